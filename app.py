@@ -1,12 +1,34 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, session
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, session, g, has_request_context, Response, stream_with_context, before_render_template, template_rendered
 from functools import wraps
+import click
 import sqlite3
 import os
+import re
 import csv
+import json
+import hashlib
+import base64
+import bisect
+import io
+import zlib
+import threading
+import time
+import uuid
+import queue
+import atexit
+import logging
+from logging.handlers import RotatingFileHandler
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from FeedbackForm import FeedbackForm
+import availability
+import metrics
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime, date
-from sqlalchemy import and_
+from datetime import datetime, date, timedelta, timezone
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 from pathlib import Path
 from typing import Dict, Any, List, Optional, Tuple
 
@@ -14,12 +36,31 @@ app = Flask(__name__)
 app.secret_key = "very-simple-secret-key"  # ADDED: for session management
 
 # The SQLite database file (USED BY BOTH sqlite3 AND SQLAlchemy)
-DATABASE = os.path.join(os.path.dirname(__file__), "cdms.db")
+# CDMS_DATABASE points the app at another file (e.g. generated test data)
+DATABASE = os.environ.get(
+    "CDMS_DATABASE", os.path.join(os.path.dirname(__file__), "cdms.db")
+)
 
 # --- SQLAlchemy config (THIS was missing) ---
 app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + DATABASE
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# --- Shared connection pool (USED BY BOTH sqlite3 AND SQLAlchemy) ---
+# get_db_connection() borrows its connection from the same pool as the ORM,
+# so both paths get the same PRAGMAs and don't fight over separate handles.
+SQLITE_BUSY_TIMEOUT_MS = 5000      # wait this long for a lock before "database is locked"
+SQLITE_CACHED_STATEMENTS = 256     # prepared statements kept per connection
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+    "pool_size": 5,
+    "max_overflow": 10,
+    "pool_pre_ping": False,
+    "connect_args": {
+        "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+        "cached_statements": SQLITE_CACHED_STATEMENTS,
+        "check_same_thread": False,  # pooled connections move between threads
+    },
+}
+
 # Now it's safe to initialize SQLAlchemy
 db = SQLAlchemy(app)
 
@@ -50,10 +91,469 @@ def login_required(f):
 # ---------------------------
 # Connect to the database
 # ---------------------------
+def configure_sqlite_connection(dbapi_conn, connection_record=None):
+    """Runs once for every new pooled connection."""
+    cur = dbapi_conn.cursor()
+    # WAL lets readers and a writer work at the same time (across workers too)
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cur.close()
+    # Unicode-aware name matching in SQL (see school_name_key)
+    dbapi_conn.create_function(
+        "school_name_key", 1,
+        lambda name: None if name is None else school_name_key(name),
+        deterministic=True,
+    )
+
+
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    """Counts the ORM queries run during the current request."""
+    if has_request_context():
+        g.query_count = g.get("query_count", 0) + 1
+
+
+with app.app_context():
+    event.listen(db.engine, "connect", configure_sqlite_connection)
+    event.listen(db.engine, "before_cursor_execute", count_query)
+
+
+@app.after_request
+def add_query_count_header(response):
+    # Lets us check pages for N+1 problems (e.g. curl -I /visits)
+    response.headers["X-Query-Count"] = str(g.get("query_count", 0))
+    return response
+
+
+# ---------------------------
+# Request / SQL / template metrics (Prometheus text at /metrics)
+# ---------------------------
+# CDMS_METRICS=0 turns all of this off: no hooks or listeners are
+# registered and get_db_connection() hands out the plain connection
+# (unless the slow-query log below still needs SQL timings).
+METRICS_ENABLED = os.environ.get("CDMS_METRICS", "1") != "0"
+
+# Slow-query log: statements slower than this are written to
+# logs/slow_queries.log with their EXPLAIN QUERY PLAN. 0 logs every
+# statement, a negative value turns the log off.
+SLOW_QUERY_MS = float(os.environ.get("CDMS_SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG_ENABLED = SLOW_QUERY_MS >= 0
+SLOW_QUERY_LOG_FILE = Path("logs") / "slow_queries.log"
+SLOW_QUERY_LOG_MAX_BYTES = 5 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 3
+SQL_TIMING_ENABLED = METRICS_ENABLED or SLOW_QUERY_LOG_ENABLED
+
+request_seconds = metrics.registry.histogram(
+    "cdms_request_duration_seconds", "Wall time per request.", ("endpoint", "method", "status")
+)
+request_sql_statements = metrics.registry.histogram(
+    "cdms_request_sql_statements", "SQL statements per request (both drivers).",
+    ("endpoint",), metrics.COUNT_BUCKETS,
+)
+request_sql_seconds = metrics.registry.histogram(
+    "cdms_request_sql_seconds", "Time spent in SQL per request (both drivers).", ("endpoint",)
+)
+sql_seconds = metrics.registry.histogram(
+    "cdms_sql_duration_seconds", "Time per SQL statement.", ("driver", "endpoint")
+)
+template_seconds = metrics.registry.histogram(
+    "cdms_template_render_seconds", "Jinja render time per template.", ("template",)
+)
+csv_write_seconds = metrics.registry.histogram(
+    "cdms_csv_write_seconds", "Time to write a report CSV.", ("report_type",)
+)
+
+
+def current_endpoint() -> str:
+    if has_request_context():
+        return request.endpoint or "unknown"
+    return "background"  # report jobs, sweeper
+
+
+def record_sql(
+    driver: str,
+    seconds: float,
+    dbapi_conn: Optional[sqlite3.Connection] = None,
+    statement: str = "",
+    parameters: Any = (),
+):
+    endpoint = current_endpoint()
+    if METRICS_ENABLED:
+        sql_seconds.observe(seconds, driver, endpoint)
+        if has_request_context():
+            g.sql_statements = g.get("sql_statements", 0) + 1
+            g.sql_seconds = g.get("sql_seconds", 0.0) + seconds
+    if SLOW_QUERY_LOG_ENABLED and seconds * 1000 >= SLOW_QUERY_MS and statement:
+        log_slow_query(driver, seconds, endpoint, dbapi_conn, statement, parameters)
+
+
+class TimedCursor:
+    """sqlite3 cursor that reports how long execute() calls take."""
+
+    def __init__(self, cursor, dbapi_conn):
+        self._cursor = cursor
+        self._dbapi_conn = dbapi_conn  # for EXPLAIN QUERY PLAN on slow statements
+
+    def execute(self, statement, parameters=()):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(statement, parameters)
+        finally:
+            record_sql("sqlite3", time.perf_counter() - started,
+                       self._dbapi_conn, statement, parameters)
+
+    def executemany(self, statement, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(statement, seq_of_parameters)
+        finally:
+            record_sql("sqlite3", time.perf_counter() - started, self._dbapi_conn,
+                       statement, seq_of_parameters[0] if seq_of_parameters else ())
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class TimedConnection(TimedCursor):
+    """
+    Wraps the pooled connection from get_db_connection() so raw sqlite3
+    statements are timed too (the ORM ones are timed by event listeners).
+    """
+
+    def __init__(self, pooled_conn):
+        super().__init__(pooled_conn, pooled_conn.driver_connection)
+
+    def executescript(self, script):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executescript(script)
+        finally:
+            # no plan for scripts: EXPLAIN only takes one statement
+            record_sql("sqlite3", time.perf_counter() - started)
+
+    def cursor(self, *args):
+        return TimedCursor(self._cursor.cursor(*args), self._dbapi_conn)
+
+
+def orm_query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def orm_query_finished(conn, cursor, statement, parameters, context, executemany):
+    if executemany:
+        parameters = parameters[0] if parameters else ()
+    record_sql("sqlalchemy", time.perf_counter() - conn.info["query_started"].pop(),
+               cursor.connection, statement, parameters)
+
+
+# ---------------------------
+# Slow-query log
+# ---------------------------
+slow_query_logger = logging.getLogger("cdms.slow_queries")
+slow_query_logger.propagate = False
+slow_query_logger.setLevel(logging.INFO)
+
+# EXPLAIN output per statement text, so a statement that is always slow
+# doesn't get re-planned every time
+slow_query_plans: "OrderedDict[str, List[str]]" = OrderedDict()
+SLOW_QUERY_PLAN_CACHE_SIZE = 256
+
+
+def normalize_sql(statement: str) -> str:
+    return " ".join(statement.split())
+
+
+def explain_query_plan(dbapi_conn: Optional[sqlite3.Connection], statement: str, parameters: Any) -> List[str]:
+    """EXPLAIN QUERY PLAN as indented lines, e.g. ['SCAN schools', 'USE TEMP B-TREE FOR ORDER BY']."""
+    key = normalize_sql(statement)
+    plan = slow_query_plans.get(key)
+    if plan is not None or dbapi_conn is None:
+        return plan or []
+
+    try:
+        rows = dbapi_conn.execute("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+    except sqlite3.Error as e:  # e.g. PRAGMAs and DDL can't be explained
+        return [f"(no plan: {e})"]
+
+    # rows are (id, parent, notused, detail); indent children under parents
+    depth = {0: -1}
+    plan = []
+    for row in rows:
+        node_id, parent, detail = row[0], row[1], row[3]
+        depth[node_id] = depth.get(parent, -1) + 1
+        plan.append("  " * depth[node_id] + detail)
+
+    slow_query_plans[key] = plan
+    while len(slow_query_plans) > SLOW_QUERY_PLAN_CACHE_SIZE:
+        slow_query_plans.popitem(last=False)
+    return plan
+
+
+def plan_warnings(plan: List[str]) -> List[str]:
+    """The parts of a plan worth a look: full table scans and temp sorts."""
+    warnings = []
+    for line in plan:
+        detail = line.strip()
+        if detail.startswith("SCAN ") and " USING " not in detail and "VIRTUAL TABLE" not in detail:
+            warnings.append("full scan: " + detail[5:])
+        if "TEMP B-TREE" in detail:
+            warnings.append("temp b-tree: " + detail.split("FOR ", 1)[-1])
+    return warnings
+
+
+def log_slow_query(driver, seconds, endpoint, dbapi_conn, statement, parameters):
+    try:
+        plan = explain_query_plan(dbapi_conn, statement, parameters)
+        slow_query_logger.info(json.dumps({
+            "at": datetime.now().isoformat(timespec="milliseconds"),
+            "ms": round(seconds * 1000, 3),
+            "driver": driver,
+            "endpoint": endpoint,
+            "path": request.path if has_request_context() else None,
+            "sql": normalize_sql(statement),
+            "params": repr(parameters)[:500],
+            "plan": plan,
+            "warnings": plan_warnings(plan),
+        }))
+    except Exception as e:  # never break the query that was being logged
+        app.logger.warning("Could not log slow query: %s", e)
+
+
+def read_slow_query_log() -> List[Dict[str, Any]]:
+    """All entries in the slow-query log files, oldest file first."""
+    files = [
+        SLOW_QUERY_LOG_FILE.with_name(f"{SLOW_QUERY_LOG_FILE.name}.{n}")
+        for n in range(SLOW_QUERY_LOG_BACKUPS, 0, -1)
+    ] + [SLOW_QUERY_LOG_FILE]
+    entries = []
+    for path in files:
+        try:
+            with path.open(encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except OSError:
+            continue
+    return entries
+
+
+if SLOW_QUERY_LOG_ENABLED:
+    SLOW_QUERY_LOG_FILE.parent.mkdir(exist_ok=True)
+    handler = RotatingFileHandler(
+        SLOW_QUERY_LOG_FILE,
+        maxBytes=SLOW_QUERY_LOG_MAX_BYTES,
+        backupCount=SLOW_QUERY_LOG_BACKUPS,
+        encoding="utf-8",
+    )
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    slow_query_logger.addHandler(handler)
+
+
+def template_started(sender, template, context, **extra):
+    g.setdefault("template_started", []).append(time.perf_counter())
+
+
+def template_finished(sender, template, context, **extra):
+    started = g.get("template_started")
+    if started:
+        template_seconds.observe(time.perf_counter() - started.pop(), template.name or "string")
+
+
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+def record_request(response):
+    started = g.get("request_started")
+    if started is not None:
+        endpoint = request.endpoint or "unknown"
+        request_seconds.observe(
+            time.perf_counter() - started, endpoint, request.method, str(response.status_code)
+        )
+        request_sql_statements.observe(g.get("sql_statements", 0), endpoint)
+        request_sql_seconds.observe(g.get("sql_seconds", 0.0), endpoint)
+    return response
+
+
+if SQL_TIMING_ENABLED:
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", orm_query_started)
+        event.listen(db.engine, "after_cursor_execute", orm_query_finished)
+
+if METRICS_ENABLED:
+    before_render_template.connect(template_started, app)
+    template_rendered.connect(template_finished, app)
+    app.before_request(start_request_timer)
+    app.after_request(record_request)
+
+
+@app.route("/metrics/slow_queries")
+@login_required
+def slow_queries():
+    """Slow statements from the log, grouped by SQL text, slowest total first."""
+    groups: Dict[str, Dict[str, Any]] = {}
+    for entry in read_slow_query_log():
+        group = groups.setdefault(entry["sql"], {
+            "sql": entry["sql"], "count": 0, "total_ms": 0.0, "max_ms": 0.0, "endpoints": set(),
+        })
+        group["count"] += 1
+        group["total_ms"] += entry["ms"]
+        if entry["ms"] >= group["max_ms"]:
+            group["max_ms"] = entry["ms"]
+            group["slowest"] = entry
+        group["endpoints"].add(entry["endpoint"])
+        group["plan"] = entry["plan"]          # latest plan
+        group["warnings"] = entry["warnings"]
+        group["last_at"] = entry["at"]
+
+    rows = sorted(groups.values(), key=lambda g_: g_["total_ms"], reverse=True)
+    return render_template(
+        "slow_queries.html",
+        rows=rows,
+        threshold_ms=SLOW_QUERY_MS,
+        enabled=SLOW_QUERY_LOG_ENABLED,
+    )
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape target (per worker process)."""
+    if not METRICS_ENABLED:
+        return Response("metrics are disabled (CDMS_METRICS=0)\n", status=404, mimetype="text/plain")
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+
 def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row  # allows column names
-    return conn
+    """
+    Returns the sqlite3 connection for the current request.
+
+    The connection is checked out of the SQLAlchemy pool the first time it is
+    needed and handed back in release_db_connection() when the request ends,
+    so handlers should NOT call conn.close() themselves.
+    """
+    if "db_conn" not in g:
+        conn = db.engine.raw_connection()
+        conn.driver_connection.row_factory = sqlite3.Row  # allows column names
+        g.db_conn = TimedConnection(conn) if SQL_TIMING_ENABLED else conn
+    return g.db_conn
+
+
+@app.teardown_appcontext
+def release_db_connection(exc):
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        # the ORM shares this pool and expects plain tuples
+        conn.driver_connection.row_factory = None
+        conn.close()  # returns it to the pool (uncommitted work is rolled back)
+
+
+# ---------------------------
+# Report read snapshots
+# ---------------------------
+# Report jobs and exports read through their own read-only connection
+# inside one read transaction, so every query of a report sees the same
+# data, and under WAL the reader never holds a lock a writer has to wait
+# for (scheduling and feedback keep going while a long report runs).
+#   CDMS_REPORT_SNAPSHOT=live   (default) read cdms.db itself; the data
+#                               is as of the moment the report started
+#   CDMS_REPORT_SNAPSHOT=copy   read a copy made with the SQLite backup
+#                               API, refreshed once it is older than
+#                               CDMS_REPORT_SNAPSHOT_MAX_AGE seconds; long
+#                               reads then never touch cdms.db (nor hold
+#                               back its WAL checkpoints)
+# Either way the report shows when its data is from (data_as_of).
+REPORT_SNAPSHOT_MODE = os.environ.get("CDMS_REPORT_SNAPSHOT", "live")
+if REPORT_SNAPSHOT_MODE not in ("live", "copy"):
+    REPORT_SNAPSHOT_MODE = "live"
+REPORT_SNAPSHOT_MAX_AGE = int(os.environ.get("CDMS_REPORT_SNAPSHOT_MAX_AGE", "300"))
+REPORT_SNAPSHOT_PATH = REPORTS_DIR / ".snapshot.db"
+
+report_snapshot_lock = threading.Lock()
+
+
+def refresh_report_snapshot() -> float:
+    """
+    Makes sure the snapshot copy is at most REPORT_SNAPSHOT_MAX_AGE seconds
+    old and returns when it was taken (its mtime). The new copy is built
+    next to the old one and swapped in, so reports still reading the old
+    file finish undisturbed.
+    """
+    with report_snapshot_lock:
+        try:
+            taken = REPORT_SNAPSHOT_PATH.stat().st_mtime
+        except FileNotFoundError:
+            taken = 0.0
+        if time.time() - taken < REPORT_SNAPSHOT_MAX_AGE:
+            return taken
+
+        REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = REPORT_SNAPSHOT_PATH.with_name(f".snapshot.{os.getpid()}.tmp")
+        tmp_path.unlink(missing_ok=True)
+        taken = time.time()
+        source = sqlite3.connect(DATABASE)
+        target = sqlite3.connect(tmp_path)
+        try:
+            source.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            source.backup(target)  # one step, so the copy is a consistent snapshot
+            target.execute("PRAGMA journal_mode=DELETE")  # plain file, opened read-only
+        finally:
+            target.close()
+            source.close()
+        os.utime(tmp_path, (taken, taken))
+        os.replace(tmp_path, REPORT_SNAPSHOT_PATH)
+        return taken
+
+
+def open_report_snapshot() -> Tuple[Any, str]:
+    """
+    Opens a read-only connection with a read transaction already started
+    and returns (connection, data_as_of). The caller closes it.
+    """
+    if REPORT_SNAPSHOT_MODE == "copy":
+        path = REPORT_SNAPSHOT_PATH
+        as_of = datetime.fromtimestamp(refresh_report_snapshot())
+    else:
+        path = Path(DATABASE)
+        as_of = datetime.now()
+
+    conn = sqlite3.connect(path.resolve().as_uri() + "?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    # The snapshot starts with the first read, not with BEGIN
+    conn.execute("BEGIN")
+    conn.execute("SELECT COUNT(*) FROM data_versions").fetchone()
+
+    if SQL_TIMING_ENABLED:
+        conn = TimedCursor(conn, conn)  # same execute() timing as TimedConnection
+    return conn, as_of.isoformat(timespec="seconds")
+
+
+@contextmanager
+def report_snapshot():
+    """
+    Runs the block against a report snapshot: get_report_connection()
+    returns the snapshot connection inside it. Yields data_as_of.
+    """
+    conn, as_of = open_report_snapshot()
+    g.report_conn = conn
+    try:
+        yield as_of
+    finally:
+        g.pop("report_conn", None)
+        conn.close()  # ends the read transaction
+
+
+def get_report_connection():
+    """The open report snapshot, or the request's connection outside one."""
+    conn = g.get("report_conn")
+    return conn if conn is not None else get_db_connection()
+
 
 def build_where_clause(
     report_type: str,
@@ -101,80 +601,748 @@ def fetch_summary(
     partner_id: Optional[int],
 ) -> Dict[str, Any]:
     """
-    Uses raw sqlite3 to summarize the visits table.
+    Uses raw sqlite3 to summarize visits.
 
-    Current visits table has:
-        - school_id
-        - visit_date
-        - visit_time
-        - status
+    Reads the pre-aggregated visit_daily_rollup table (one row per day,
+    school and status) instead of the raw visits table. It has the same
+    visit_date and school_id columns, so build_where_clause works on both.
+    Partner filters read partner_daily_rollup for the visit and attendance
+    totals; only the distinct-school count goes to the visits table, where
+    idx_visits_partner_date covers it.
 
     We will calculate:
         - number_of_schools  (distinct school_id)
-        - number_of_visits   (total rows)
+        - number_of_visits   (total visits)
         - total_students / total_teachers / total_parents
-          (set to 0 for now, since those columns don't exist yet)
+          (attendance of Completed visits; the rollup keeps the sums)
     """
-    conn = get_db_connection()
-    try:
-        where_clause, params = build_where_clause(
-            report_type, start_date, end_date, school_id, partner_id
-        )
+    conn = get_report_connection()
+
+    where_clause, params = build_where_clause(
+        report_type, start_date, end_date, school_id, partner_id
+    )
 
+    if report_type == "by_partner" and partner_id is not None:
+        query = f"""
+            SELECT
+                (SELECT COUNT(DISTINCT school_id) FROM visits {where_clause})
+                                          AS number_of_schools,
+                SUM(visit_count)          AS number_of_visits,
+                SUM(students)             AS total_students,
+                SUM(teachers)             AS total_teachers,
+                SUM(parents)              AS total_parents
+            FROM partner_daily_rollup
+            {where_clause};
+        """
+        params = params * 2
+    else:
+        # Distinct schools are counted over rollup rows, which is the small
+        # correction needed since one school appears on many days.
         query = f"""
             SELECT
                 COUNT(DISTINCT school_id) AS number_of_schools,
-                COUNT(*)                  AS number_of_visits
-            FROM visits
+                SUM(visit_count)          AS number_of_visits,
+                SUM(students)             AS total_students,
+                SUM(teachers)             AS total_teachers,
+                SUM(parents)              AS total_parents
+            FROM visit_daily_rollup
             {where_clause};
         """
 
-        cur = conn.execute(query, params)
-        row = cur.fetchone()
+    cur = conn.execute(query, params)
+    row = cur.fetchone()
 
-        if row is None:
-            return {
-                "number_of_schools": 0,
-                "number_of_visits": 0,
-                "total_students": 0,
-                "total_teachers": 0,
-                "total_parents": 0,
-            }
-
-        # row is a sqlite3.Row → we can read by key
-        summary = {
-            "number_of_schools": row["number_of_schools"] or 0,
-            "number_of_visits": row["number_of_visits"] or 0,
-            # These are placeholders since we don't track them yet
+    if row is None:
+        return {
+            "number_of_schools": 0,
+            "number_of_visits": 0,
             "total_students": 0,
             "total_teachers": 0,
             "total_parents": 0,
         }
 
-        return summary
-    finally:
-        conn.close()
+    # row is a sqlite3.Row → we can read by key
+    summary = {
+        "number_of_schools": row["number_of_schools"] or 0,
+        "number_of_visits": row["number_of_visits"] or 0,
+        # Attendance is recorded when visits are marked Completed
+        "total_students": row["total_students"] or 0,
+        "total_teachers": row["total_teachers"] or 0,
+        "total_parents": row["total_parents"] or 0,
+    }
 
+    return summary
 
 
-def write_csv(summary: Dict[str, Any], report_type: str) -> Path:
+
+REPORT_TOP_PARTNERS = 10        # default N for the top-partners report
+REPORT_TOP_PARTNERS_MAX = 100
+
+
+def fetch_top_partners(
+    start_date: Optional[date], end_date: Optional[date], limit: int
+) -> Dict[str, Any]:
+    """
+    The `limit` partners with the most visits in the date range.
+
+    Ranks partners from partner_daily_rollup (one row per partner per
+    day), then counts distinct schools for just the top ones with
+    index-only range scans on idx_visits_partner_date, so the visits
+    table is never scanned as a whole.
+    """
+    conn = get_report_connection()
+    where_clause, params = build_where_clause("top_partners", start_date, end_date, None, None)
+
+    top = conn.execute(
+        f"""
+        SELECT partner_id,
+               SUM(visit_count)                 AS visits,
+               COUNT(*) OVER ()                 AS partners,
+               SUM(SUM(visit_count)) OVER ()    AS total_visits
+        FROM partner_daily_rollup
+        {where_clause}
+        GROUP BY partner_id
+        ORDER BY visits DESC, partner_id
+        LIMIT ?
+        """,
+        (*params, limit),
+    ).fetchall()
+
+    ids = json.dumps([r["partner_id"] for r in top])
+    names = {
+        r["id"]: r["name"]
+        for r in conn.execute(
+            "SELECT id, name FROM partners WHERE id IN (SELECT value FROM json_each(?))", (ids,)
+        )
+    }
+    date_conditions = where_clause.replace("WHERE ", "AND ", 1)
+    schools = {
+        r["partner_id"]: r["schools"]
+        for r in conn.execute(
+            f"""
+            SELECT partner_id, COUNT(DISTINCT school_id) AS schools
+            FROM visits
+            WHERE partner_id IN (SELECT value FROM json_each(?)) {date_conditions}
+            GROUP BY partner_id
+            """,
+            (ids, *params),
+        )
+    }
+
+    return {
+        "number_of_partners": top[0]["partners"] if top else 0,
+        "number_of_visits": top[0]["total_visits"] if top else 0,
+        "breakdown": {
+            "columns": ["rank", "partner", "visits", "schools"],
+            "rows": [
+                [rank, names.get(r["partner_id"], f"Partner {r['partner_id']}"),
+                 r["visits"], schools.get(r["partner_id"], 0)]
+                for rank, r in enumerate(top, start=1)
+            ],
+        },
+    }
+
+
+# ---------------------------
+# Time-series / breakdown reports
+# ---------------------------
+# SQL for each time bucket, applied to visit_date ('YYYY-MM-DD')
+REPORT_BUCKETS = {
+    "day": "visit_date",
+    "week": "date(visit_date, 'weekday 0', '-6 days')",  # Monday of that week
+    "month": "substr(visit_date, 1, 7)",
+}
+REPORT_BREAKDOWNS = ("school", "status")
+
+
+def fetch_time_series(
+    report_type: str,
+    start_date: Optional[date],
+    end_date: Optional[date],
+    school_id: Optional[int],
+    partner_id: Optional[int],
+    bucket: Optional[str],
+    breakdown: Optional[str],
+) -> Dict[str, Any]:
+    """
+    Visits and distinct schools per time bucket (day / week / month),
+    optionally split by school or status, plus the overall totals.
+
+    Everything comes from a single GROUP BY over the rollup (or visits,
+    for partner filters): rows are grouped down to (bucket, breakdown,
+    school) and folded here, so distinct-school counts stay exact for
+    every bucket and for the totals without a second scan. Partner
+    attendance totals come from partner_daily_rollup instead, so the
+    visits query stays on idx_visits_partner_date.
+
+    Returns the usual summary keys plus "breakdown":
+        {"columns": [...], "rows": [[period, group, visits, schools], ...]}
+    """
+    where_clause, params = build_where_clause(
+        report_type, start_date, end_date, school_id, partner_id
+    )
+    by_partner = report_type == "by_partner" and partner_id is not None
+    attendance_sql = ", ".join(f"IFNULL(SUM({c}), 0) AS {c}" for c in ATTENDANCE_COLUMNS)
+    if by_partner:
+        source, count_sql, status_sql = "visits", "COUNT(*)", "IFNULL(status, '')"
+        series_attendance_sql = ", ".join(f"0 AS {c}" for c in ATTENDANCE_COLUMNS)
+    else:
+        source, count_sql, status_sql = "visit_daily_rollup", "SUM(visit_count)", "status"
+        series_attendance_sql = attendance_sql
+    bucket_sql = REPORT_BUCKETS.get(bucket, "''")
+    group_sql = {"school": "school_id", "status": status_sql}.get(breakdown, "''")
+
+    conn = get_report_connection()
+    rows = conn.execute(
+        f"""
+        SELECT {bucket_sql} AS period, {group_sql} AS grp, school_id,
+               {count_sql} AS visits, {series_attendance_sql}
+        FROM {source}
+        {where_clause}
+        GROUP BY period, grp, school_id
+        ORDER BY period, grp
+        """,
+        params,
+    ).fetchall()
+
+    series: "OrderedDict[Tuple[Any, Any], List[Any]]" = OrderedDict()
+    all_schools = set()
+    total_visits = 0
+    attendance = dict.fromkeys(ATTENDANCE_COLUMNS, 0)
+    for r in rows:
+        entry = series.setdefault((r["period"], r["grp"]), [0, set()])
+        entry[0] += r["visits"]
+        entry[1].add(r["school_id"])
+        all_schools.add(r["school_id"])
+        total_visits += r["visits"]
+        for column in ATTENDANCE_COLUMNS:
+            attendance[column] += r[column]
+    if by_partner:
+        totals = conn.execute(
+            f"SELECT {attendance_sql} FROM partner_daily_rollup {where_clause}", params
+        ).fetchone()
+        attendance = {column: totals[column] for column in ATTENDANCE_COLUMNS}
+
+    names = school_lookup()["by_id"] if breakdown == "school" else {}
+    columns = [bucket or "period", breakdown or "group", "visits", "schools"]
+    out_rows = []
+    for (period, grp), (visits, schools) in series.items():
+        if breakdown == "school":
+            grp = names.get(grp, {}).get("name", f"School {grp}")
+        out_rows.append([period, grp, visits, len(schools)])
+
+    # Drop the columns that weren't asked for
+    keep = [i for i, used in enumerate([bucket, breakdown, True, True]) if used]
+    return {
+        "number_of_schools": len(all_schools),
+        "number_of_visits": total_visits,
+        "total_students": attendance["students"],
+        "total_teachers": attendance["teachers"],
+        "total_parents": attendance["parents"],
+        "breakdown": {
+            "columns": [columns[i] for i in keep],
+            "rows": [[row[i] for i in keep] for row in out_rows],
+        },
+    }
+
+
+def write_csv(
+    summary: Dict[str, Any], report_type: str, filename: Optional[str] = None
+) -> Path:
     """
     Writes the summary dict out to a CSV file in REPORTS_DIR and
-    returns the file path.
+    returns the file path. Without a filename, a timestamped one is used.
     """
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"summary_{report_type}_{timestamp}.csv"
+    if filename is None:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        filename = f"summary_{report_type}_{timestamp}.csv"
     output_path = REPORTS_DIR / filename
 
-    with output_path.open("w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["Metric", "Value"])
-        for key, value in summary.items():
-            writer.writerow([key, value])
+    # Write to a temp file first so nobody downloads a half-written report
+    tmp_path = output_path.with_suffix(".tmp")
+    with metrics.timed(csv_write_seconds if METRICS_ENABLED else None, report_type):
+        with tmp_path.open("w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Metric", "Value"])
+            for key, value in summary.items():
+                if key != "breakdown":
+                    writer.writerow([key, value])
+            breakdown = summary.get("breakdown")
+            if breakdown:
+                writer.writerow([])
+                writer.writerow(breakdown["columns"])
+                writer.writerows(breakdown["rows"])
+        os.replace(tmp_path, output_path)
 
     return output_path
 
 
+# ---------------------------
+# Report result cache
+# ---------------------------
+REPORT_CACHE_SIZE = 128       # entries kept in memory per worker
+REPORT_CACHE_SHARED = True    # also keep entries on disk, shared by all gunicorn workers
+REPORT_CACHE_DIR = REPORTS_DIR / ".cache"
+
+
+def report_cache_key(
+    report_type: str,
+    start_date: Optional[date],
+    end_date: Optional[date],
+    school_id: Optional[int],
+    partner_id: Optional[int],
+    bucket: Optional[str] = None,
+    breakdown: Optional[str] = None,
+    top_n: Optional[int] = None,
+) -> Tuple[Any, ...]:
+    """
+    Normalized key for a report: the same filters always give the same
+    key, and filters that don't apply to the report type are ignored
+    (because build_where_clause ignores them too).
+    """
+    where_clause, params = build_where_clause(
+        report_type, start_date, end_date, school_id, partner_id
+    )
+    if report_type == "top_partners":
+        return (report_type, where_clause, *params, "top", top_n)
+    if bucket or breakdown:
+        return (report_type, where_clause, *params, "series", bucket, breakdown)
+    return (report_type, where_clause, *params)
+
+
+def report_name_versions(
+    report_type: str, breakdown: Optional[str], conn=None
+) -> Tuple[Any, ...]:
+    """
+    Versions of the tables whose names a report shows, to append to its
+    cache key (the visits version is the data version already). Renaming
+    a school or partner then gives a new key (and file name, hence ETag),
+    so no cached report or stored file keeps showing the old name.
+    """
+    if report_type == "top_partners":
+        tables: Tuple[str, ...] = ("partners",)
+    elif breakdown == "school":
+        tables = ("schools",)
+    else:
+        tables = ()
+    return tuple(part for table in tables for part in (table, get_data_version(table, conn)))
+
+
+class ReportCache:
+    """
+    LRU cache of generated reports: key → (summary dict, CSV file path).
+
+    Every entry remembers the visits data version it was built from, so
+    any write to visits (which bumps that version) makes it stale.
+    """
+
+    def __init__(self, max_size: int, disk_dir: Optional[Path] = None):
+        self.max_size = max_size
+        self.disk_dir = disk_dir
+        self.entries: "OrderedDict[Tuple[Any, ...], Tuple[int, Dict[str, Any], Path]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir is not None:
+            disk_dir.mkdir(parents=True, exist_ok=True)
+
+    def _disk_path(self, key: Tuple[Any, ...]) -> Path:
+        digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+        return self.disk_dir / f"{digest}.json"
+
+    def get(self, key: Tuple[Any, ...], version: int) -> Optional[Tuple[Dict[str, Any], Path]]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] == version and entry[2].exists():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], entry[2]
+
+        if self.disk_dir is not None:
+            try:
+                stored = json.loads(self._disk_path(key).read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                stored = None
+            if stored and stored["version"] == version:
+                path = REPORTS_DIR / stored["file"]
+                if path.exists():
+                    self._touch(key)
+                    self._remember(key, version, stored["summary"], path)
+                    with self.lock:
+                        self.disk_hits += 1
+                    return stored["summary"], path
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: Tuple[Any, ...], version: int, summary: Dict[str, Any], path: Path):
+        self._remember(key, version, summary, path)
+        if self.disk_dir is not None:
+            data = {"version": version, "summary": summary, "file": path.name}
+            tmp = self._disk_path(key).with_suffix(".tmp")
+            tmp.write_text(json.dumps(data), encoding="utf-8")
+            os.replace(tmp, self._disk_path(key))  # atomic for other workers
+
+    def _touch(self, key):
+        """Marks a disk entry as used, for sweep_disk's age limit."""
+        try:
+            os.utime(self._disk_path(key))
+        except OSError:
+            pass
+
+    def sweep_disk(self, max_age_seconds: float) -> int:
+        """
+        Deletes disk entries whose report file is gone (swept) or that
+        weren't used for max_age_seconds, plus leftover temp files.
+        Returns how many were deleted.
+        """
+        if self.disk_dir is None:
+            return 0
+        cutoff = time.time() - max_age_seconds
+        deleted = 0
+        for path in self.disk_dir.iterdir():
+            try:
+                if path.suffix == ".json" and path.stat().st_mtime >= cutoff:
+                    stored = json.loads(path.read_text(encoding="utf-8"))
+                    if (REPORTS_DIR / stored["file"]).exists():
+                        continue
+                elif path.suffix == ".tmp" and path.stat().st_mtime >= cutoff:
+                    continue  # probably being written right now
+            except (OSError, ValueError, KeyError, TypeError):
+                pass  # unreadable entries go too
+            path.unlink(missing_ok=True)
+            deleted += 1
+        return deleted
+
+    def _remember(self, key, version, summary, path):
+        with self.lock:
+            self.entries[key] = (version, summary, path)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self.entries),
+                "max_size": self.max_size,
+            }
+
+
+report_cache = ReportCache(
+    REPORT_CACHE_SIZE, REPORT_CACHE_DIR if REPORT_CACHE_SHARED else None
+)
+
+
+# ---------------------------
+# Report file storage + retention
+# ---------------------------
+# Report files are named after a hash of their filters and the visits data
+# version, so asking for the same report twice reuses the same file. The
+# report_files table indexes them for download_report and the sweeper.
+REPORT_MAX_AGE_DAYS = 30             # delete reports not used for this long
+REPORT_MAX_FILES = 500               # keep at most this many report files
+REPORT_MAX_BYTES = 50 * 1024 * 1024  # and at most this much disk space
+REPORT_SWEEP_INTERVAL = 600          # seconds between sweeper runs
+REPORT_SWEEPER_ENABLED = True
+REPORT_DOWNLOAD_MAX_AGE = 3600       # seconds browsers may reuse a download without asking
+
+
+def report_file_name(cache_key: Tuple[Any, ...], data_version: int) -> str:
+    digest = hashlib.sha256(repr((cache_key, data_version)).encode("utf-8")).hexdigest()
+    return f"summary_{cache_key[0]}_{digest[:20]}.csv"
+
+
+def store_report(
+    summary: Dict[str, Any],
+    report_type: str,
+    cache_key: Tuple[Any, ...],
+    data_version: int,
+) -> Path:
+    """
+    Returns the stored CSV for this report, writing it only if an
+    identical one (same filters, same data version) isn't stored yet.
+    """
+    filename = report_file_name(cache_key, data_version)
+    conn = get_db_connection()
+    now = datetime.now().isoformat(timespec="seconds")
+
+    row = conn.execute(
+        "SELECT filename FROM report_files WHERE filename = ?", (filename,)
+    ).fetchone()
+    output_path = REPORTS_DIR / filename
+    if row and output_path.exists():
+        conn.execute(
+            "UPDATE report_files SET last_accessed = ? WHERE filename = ?",
+            (now, filename),
+        )
+        conn.commit()
+        return output_path
+
+    output_path = write_csv(summary, report_type, filename)
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO report_files
+            (filename, report_type, data_version, size_bytes, created_at, last_accessed)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (filename, report_type, data_version, output_path.stat().st_size, now, now),
+    )
+    conn.commit()
+    return output_path
+
+
+def sweep_reports(conn) -> int:
+    """
+    Applies the retention policy to indexed report files: first by age,
+    then least recently used until both the count and size limits fit.
+    Cache entries on disk for deleted (or unused) reports go as well.
+    Returns how many report files were deleted.
+    """
+    cutoff = datetime.fromtimestamp(
+        time.time() - REPORT_MAX_AGE_DAYS * 86400
+    ).isoformat(timespec="seconds")
+    doomed = [
+        r["filename"]
+        for r in conn.execute(
+            "SELECT filename FROM report_files WHERE last_accessed < ?", (cutoff,)
+        )
+    ]
+
+    total = conn.execute(
+        """
+        SELECT COUNT(*) AS files, IFNULL(SUM(size_bytes), 0) AS bytes
+        FROM report_files WHERE last_accessed >= ?
+        """,
+        (cutoff,),
+    ).fetchone()
+    files, size = total["files"], total["bytes"]
+    if files > REPORT_MAX_FILES or size > REPORT_MAX_BYTES:
+        for r in conn.execute(
+            """
+            SELECT filename, size_bytes FROM report_files
+            WHERE last_accessed >= ?
+            ORDER BY last_accessed ASC
+            """,
+            (cutoff,),
+        ):
+            if files <= REPORT_MAX_FILES and size <= REPORT_MAX_BYTES:
+                break
+            doomed.append(r["filename"])
+            files -= 1
+            size -= r["size_bytes"]
+
+    for filename in doomed:
+        (REPORTS_DIR / filename).unlink(missing_ok=True)
+        conn.execute("DELETE FROM report_files WHERE filename = ?", (filename,))
+    report_cache.sweep_disk(REPORT_MAX_AGE_DAYS * 86400)
+    conn.execute(
+        "DELETE FROM report_jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+        (cutoff,),
+    )
+    conn.commit()
+    return len(doomed)
+
+
+def report_sweeper_loop():
+    while True:
+        time.sleep(REPORT_SWEEP_INTERVAL)
+        try:
+            with app.app_context():
+                sweep_reports(get_db_connection())
+        except Exception as e:  # keep sweeping even if one run fails
+            app.logger.warning("Report sweep failed: %s", e)
+
+
+def start_report_sweeper():
+    thread = threading.Thread(target=report_sweeper_loop, name="report-sweeper", daemon=True)
+    thread.start()
+
+
+# ---------------------------
+# Background report jobs
+# ---------------------------
+# Reports are built off the request thread: POST /reports queues a job
+# (a row in report_jobs) and the browser polls its status. A second
+# request for the same report while it is queued or running joins the
+# existing job instead of starting another one.
+REPORT_JOB_WORKERS = 2               # report threads per gunicorn worker
+REPORT_JOB_STALE_SECONDS = 300       # "running" jobs not updated for this long are retried
+REPORT_JOB_POLL_SECONDS = 2          # how often the status page refreshes
+
+report_job_pool = ThreadPoolExecutor(max_workers=REPORT_JOB_WORKERS, thread_name_prefix="report-job")
+
+
+def submit_report_job(
+    report_type: str,
+    start_date: Optional[date],
+    end_date: Optional[date],
+    school_id: Optional[int],
+    partner_id: Optional[int],
+    bucket: Optional[str] = None,
+    breakdown: Optional[str] = None,
+    top_n: Optional[int] = None,
+) -> str:
+    """
+    Queues a report and returns its job id. Identical reports (same
+    filters, same visits data) share one job: a queued or running one is
+    joined, and a finished one whose file still exists is reused.
+    """
+    cache_key = report_cache_key(
+        report_type, start_date, end_date, school_id, partner_id, bucket, breakdown, top_n
+    ) + report_name_versions(report_type, breakdown)
+    job_key = report_file_name(cache_key, get_data_version("visits"))
+    params = {
+        "report_type": report_type,
+        "start_date": start_date.isoformat() if start_date else None,
+        "end_date": end_date.isoformat() if end_date else None,
+        "school_id": school_id,
+        "partner_id": partner_id,
+        "bucket": bucket,
+        "breakdown": breakdown,
+        "top_n": top_n,
+    }
+    now = datetime.now().isoformat(timespec="seconds")
+    conn = get_db_connection()
+
+    done = conn.execute(
+        """
+        SELECT id, filename FROM report_jobs
+        WHERE job_key = ? AND status = 'done'
+        ORDER BY updated_at DESC LIMIT 1
+        """,
+        (job_key,),
+    ).fetchone()
+    if done and (REPORTS_DIR / done["filename"]).exists():
+        return done["id"]
+
+    # The partial unique index lets only one active job per key in
+    conn.execute(
+        """
+        INSERT INTO report_jobs (id, job_key, params, status, progress, created_at, updated_at)
+        VALUES (?, ?, ?, 'queued', 0, ?, ?)
+        ON CONFLICT (job_key) WHERE status IN ('queued', 'running') DO NOTHING
+        """,
+        (uuid.uuid4().hex, job_key, json.dumps(params), now, now),
+    )
+    conn.commit()
+    job = conn.execute(
+        """
+        SELECT id, status FROM report_jobs
+        WHERE job_key = ? AND status IN ('queued', 'running')
+        """,
+        (job_key,),
+    ).fetchone()
+    if job is None:  # the active job finished in the meantime
+        job = conn.execute(
+            "SELECT id, status FROM report_jobs WHERE job_key = ? ORDER BY updated_at DESC LIMIT 1",
+            (job_key,),
+        ).fetchone()
+    if job["status"] == "queued":
+        report_job_pool.submit(run_report_job, job["id"])
+    return job["id"]
+
+
+def update_report_job(conn, job_id: str, **fields):
+    fields["updated_at"] = datetime.now().isoformat(timespec="seconds")
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    conn.execute(f"UPDATE report_jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+    conn.commit()
+
+
+def run_report_job(job_id: str):
+    """Builds one report (runs on the job pool)."""
+    with app.app_context():
+        conn = get_db_connection()
+        # Claim the job; if another thread or worker got there first, stop
+        claimed = conn.execute(
+            "UPDATE report_jobs SET status = 'running', progress = 10, updated_at = ? "
+            "WHERE id = ? AND status = 'queued'",
+            (datetime.now().isoformat(timespec="seconds"), job_id),
+        ).rowcount
+        conn.commit()
+        if not claimed:
+            return
+
+        try:
+            params = json.loads(conn.execute(
+                "SELECT params FROM report_jobs WHERE id = ?", (job_id,)
+            ).fetchone()["params"])
+            report_type = params["report_type"]
+            start_date = parse_iso_date(params["start_date"])
+            end_date = parse_iso_date(params["end_date"])
+
+            bucket = params.get("bucket")
+            breakdown = params.get("breakdown")
+            top_n = params.get("top_n")
+
+            # All reads come from one snapshot (see report_snapshot); the
+            # data versions are read from it too, so a copy that lags the
+            # live database is never stored under a newer version
+            with report_snapshot() as data_as_of:
+                cache_key = report_cache_key(
+                    report_type, start_date, end_date, params["school_id"], params["partner_id"],
+                    bucket, breakdown, top_n,
+                ) + report_name_versions(report_type, breakdown, get_report_connection())
+                data_version = get_data_version("visits", get_report_connection())
+                cached = report_cache.get(cache_key, data_version)
+                if cached:
+                    summary, output_path = cached
+                elif report_type == "top_partners":
+                    summary = fetch_top_partners(start_date, end_date, top_n or REPORT_TOP_PARTNERS)
+                elif bucket or breakdown:
+                    summary = fetch_time_series(
+                        report_type, start_date, end_date,
+                        params["school_id"], params["partner_id"], bucket, breakdown,
+                    )
+                else:
+                    summary = fetch_summary(
+                        report_type=report_type,
+                        start_date=start_date,
+                        end_date=end_date,
+                        school_id=params["school_id"],
+                        partner_id=params["partner_id"],
+                    )
+            if not cached:
+                summary["data_as_of"] = data_as_of
+                update_report_job(conn, job_id, progress=70)
+                output_path = store_report(summary, report_type, cache_key, data_version)
+                report_cache.put(cache_key, data_version, summary, output_path)
+
+            update_report_job(
+                conn, job_id, status="done", progress=100,
+                filename=output_path.name, summary=json.dumps(summary),
+            )
+        except Exception as e:
+            conn.rollback()
+            app.logger.exception("Report job %s failed", job_id)
+            update_report_job(conn, job_id, status="failed", error=str(e))
+
+
+def resume_report_jobs():
+    """
+    Picks up jobs left behind by a restart: queued ones, and running ones
+    whose worker stopped updating them.
+    """
+    stale = datetime.fromtimestamp(
+        time.time() - REPORT_JOB_STALE_SECONDS
+    ).isoformat(timespec="seconds")
+    conn = get_db_connection()
+    conn.execute(
+        "UPDATE report_jobs SET status = 'queued', progress = 0 "
+        "WHERE status = 'running' AND updated_at < ?",
+        (stale,),
+    )
+    conn.commit()
+    for r in conn.execute("SELECT id FROM report_jobs WHERE status = 'queued'").fetchall():
+        report_job_pool.submit(run_report_job, r["id"])
+
+
 # ---------- MODELS ----------
 
 class School(db.Model):
@@ -194,16 +1362,39 @@ class School(db.Model):
     visits = db.relationship('Visit', backref='school', lazy=True)
 
 
+class Partner(db.Model):
+    __tablename__ = "partners"
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(150), nullable=False, unique=True)
+    contact_person = db.Column(db.String(100))
+    contact_email = db.Column(db.String(120))
+
+    visits = db.relationship('Visit', backref='partner', lazy=True)
+
+
 class Visit(db.Model):
     __tablename__ = "visits"
 
     id = db.Column(db.Integer, primary_key=True)
     # FK must point to "schools.id" now
     school_id = db.Column(db.Integer, db.ForeignKey('schools.id'), nullable=False)
+    # Organisation running the visit (optional)
+    partner_id = db.Column(db.Integer, db.ForeignKey('partners.id'), nullable=True)
+    # Attendance, recorded when the visit is marked Completed
+    students = db.Column(db.Integer)
+    teachers = db.Column(db.Integer)
+    parents = db.Column(db.Integer)
     visit_date = db.Column(db.Date, nullable=False)
     visit_time = db.Column(db.String(20), nullable=False)
     status = db.Column(db.String(20), default='Scheduled')  # Scheduled/Completed
 
+    # Only one visit per date + time slot (SRS: 3.3). The database enforces
+    # it, so two workers can't both book the same slot.
+    __table_args__ = (
+        db.Index('uq_visits_date_time', 'visit_date', 'visit_time', unique=True),
+    )
+
     feedbacks = db.relationship('Feedback', backref='visit', lazy=True)
 
 
@@ -225,6 +1416,781 @@ class Feedback(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+# ---------- SCHEMA EXTRAS ----------
+# Indexes, triggers and helper tables that the models above don't describe.
+# Everything here is idempotent, so it is safe to run on every startup.
+
+SCHEMA_FILE = os.path.join(os.path.dirname(__file__), "schools_schema.sql")
+
+# Tables whose writes bump a counter in data_versions (used for caching)
+DATA_VERSION_TABLES = ("schools", "visits", "feedback", "partners")
+
+SCHEMA_EXTRAS = """
+CREATE INDEX IF NOT EXISTS idx_schools_name_id ON schools (name, id);
+CREATE INDEX IF NOT EXISTS idx_schools_lower_name ON schools (LOWER(name));
+CREATE INDEX IF NOT EXISTS idx_visits_date_id ON visits (visit_date, id);
+CREATE INDEX IF NOT EXISTS idx_feedback_created_id ON feedback (created_at, id);
+-- by_partner reports: one partner's visits in a date range, schools included
+CREATE INDEX IF NOT EXISTS idx_visits_partner_date ON visits (partner_id, visit_date, school_id);
+
+CREATE TABLE IF NOT EXISTS report_files (
+    filename      TEXT PRIMARY KEY,
+    report_type   TEXT NOT NULL,
+    data_version  INTEGER NOT NULL,
+    size_bytes    INTEGER NOT NULL,
+    created_at    TEXT NOT NULL,
+    last_accessed TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_report_files_accessed ON report_files (last_accessed);
+
+CREATE TABLE IF NOT EXISTS report_jobs (
+    id         TEXT PRIMARY KEY,
+    job_key    TEXT NOT NULL,        -- same as the report's file name
+    params     TEXT NOT NULL,        -- JSON filters
+    status     TEXT NOT NULL,        -- queued / running / done / failed
+    progress   INTEGER NOT NULL DEFAULT 0,
+    filename   TEXT,
+    summary    TEXT,                 -- JSON, once done
+    error      TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_report_jobs_active
+    ON report_jobs (job_key) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS idx_report_jobs_key ON report_jobs (job_key, status);
+CREATE INDEX IF NOT EXISTS idx_report_jobs_updated ON report_jobs (updated_at);
+
+CREATE TABLE IF NOT EXISTS data_versions (
+    table_name TEXT PRIMARY KEY,
+    version    INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT
+);
+"""
+
+
+def data_version_triggers(table: str) -> str:
+    """SQL for the triggers that bump data_versions on every write to `table`."""
+    bump = (
+        "UPDATE data_versions SET version = version + 1, "
+        f"updated_at = CURRENT_TIMESTAMP WHERE table_name = '{table}';"
+    )
+    sql = (
+        "INSERT OR IGNORE INTO data_versions (table_name, version, updated_at) "
+        f"VALUES ('{table}', 0, CURRENT_TIMESTAMP);\n"
+    )
+    for action in ("INSERT", "UPDATE", "DELETE"):
+        sql += (
+            f"CREATE TRIGGER IF NOT EXISTS {table}_version_{action.lower()} "
+            f"AFTER {action} ON {table} BEGIN {bump} END;\n"
+        )
+    return sql
+
+
+# Full-text search (SQLite FTS5). The *_fts tables are "external content"
+# indexes: they store only the index, and triggers keep them in sync with
+# the real tables on insert, update and delete.
+FTS_ENABLED = True  # switched off in ensure_schema() if FTS5 isn't compiled in
+
+SEARCH_INDEXES = {
+    # fts table: (source table, indexed columns)
+    "schools_fts": ("schools", ("name", "address", "contact_person")),
+    "feedback_fts": ("feedback", ("Name", "School_name", "Feedback")),
+}
+
+
+def search_index_schema(fts_table: str) -> str:
+    """SQL for an FTS5 index over a table plus its sync triggers."""
+    table, columns = SEARCH_INDEXES[fts_table]
+    cols = ", ".join(f'"{c}"' for c in columns)
+    new_vals = ", ".join(f'new."{c}"' for c in columns)
+    old_vals = ", ".join(f'old."{c}"' for c in columns)
+    delete_old = (
+        f"INSERT INTO {fts_table} ({fts_table}, rowid, {cols}) "
+        f"VALUES ('delete', old.id, {old_vals});"
+    )
+    insert_new = (
+        f"INSERT INTO {fts_table} (rowid, {cols}) VALUES (new.id, {new_vals});"
+    )
+    return f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5(
+    {cols},
+    content='{table}',
+    content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {table} BEGIN
+    {insert_new}
+END;
+CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {table} BEGIN
+    {delete_old}
+END;
+CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {cols} ON {table} BEGIN
+    {delete_old}
+    {insert_new}
+END;
+"""
+
+
+def ensure_search_indexes(conn):
+    global FTS_ENABLED
+    for fts_table in SEARCH_INDEXES:
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (fts_table,),
+        ).fetchone()
+        try:
+            conn.executescript(search_index_schema(fts_table))
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5 → fall back to LIKE searches
+            FTS_ENABLED = False
+            return
+        if not exists:
+            # First time: index the rows that are already there
+            conn.execute(f"INSERT INTO {fts_table} ({fts_table}) VALUES ('rebuild')")
+
+
+def fts_match_query(search_term: str) -> Optional[str]:
+    """
+    Turns what the user typed into an FTS5 query where every word is a
+    prefix match, e.g. "kings high" → '"kings"* "high"*' (all words must match).
+    Returns None if there is nothing searchable in the text.
+    """
+    words = re.findall(r"\w+", search_term)
+    if not words:
+        return None
+    return " ".join(f'"{w}"*' for w in words)
+
+
+# Pre-aggregated visit counts per (day, school, status). Triggers keep the
+# rollup current on every insert, delete and update of visits, so summary
+# reports read a few rollup rows instead of scanning the visits table.
+VISIT_ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS visit_daily_rollup (
+    visit_date  TEXT    NOT NULL,
+    school_id   INTEGER NOT NULL,
+    status      TEXT    NOT NULL,
+    visit_count INTEGER NOT NULL DEFAULT 0,
+    students    INTEGER NOT NULL DEFAULT 0,
+    teachers    INTEGER NOT NULL DEFAULT 0,
+    parents     INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (visit_date, school_id, status)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_visit_rollup_school_date
+    ON visit_daily_rollup (school_id, visit_date);
+
+CREATE TRIGGER IF NOT EXISTS visits_rollup_ai AFTER INSERT ON visits BEGIN
+    INSERT INTO visit_daily_rollup
+        (visit_date, school_id, status, visit_count, students, teachers, parents)
+    VALUES (new.visit_date, new.school_id, IFNULL(new.status, ''), 1,
+            IFNULL(new.students, 0), IFNULL(new.teachers, 0), IFNULL(new.parents, 0))
+    ON CONFLICT (visit_date, school_id, status)
+    DO UPDATE SET visit_count = visit_count + 1,
+                  students = students + excluded.students,
+                  teachers = teachers + excluded.teachers,
+                  parents = parents + excluded.parents;
+END;
+
+CREATE TRIGGER IF NOT EXISTS visits_rollup_ad AFTER DELETE ON visits BEGIN
+    UPDATE visit_daily_rollup
+    SET visit_count = visit_count - 1,
+        students = students - IFNULL(old.students, 0),
+        teachers = teachers - IFNULL(old.teachers, 0),
+        parents = parents - IFNULL(old.parents, 0)
+    WHERE visit_date = old.visit_date AND school_id = old.school_id
+      AND status = IFNULL(old.status, '');
+    DELETE FROM visit_daily_rollup
+    WHERE visit_date = old.visit_date AND school_id = old.school_id
+      AND status = IFNULL(old.status, '') AND visit_count <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS visits_rollup_au
+AFTER UPDATE OF visit_date, school_id, status, students, teachers, parents ON visits BEGIN
+    UPDATE visit_daily_rollup
+    SET visit_count = visit_count - 1,
+        students = students - IFNULL(old.students, 0),
+        teachers = teachers - IFNULL(old.teachers, 0),
+        parents = parents - IFNULL(old.parents, 0)
+    WHERE visit_date = old.visit_date AND school_id = old.school_id
+      AND status = IFNULL(old.status, '');
+    DELETE FROM visit_daily_rollup
+    WHERE visit_date = old.visit_date AND school_id = old.school_id
+      AND status = IFNULL(old.status, '') AND visit_count <= 0;
+    INSERT INTO visit_daily_rollup
+        (visit_date, school_id, status, visit_count, students, teachers, parents)
+    VALUES (new.visit_date, new.school_id, IFNULL(new.status, ''), 1,
+            IFNULL(new.students, 0), IFNULL(new.teachers, 0), IFNULL(new.parents, 0))
+    ON CONFLICT (visit_date, school_id, status)
+    DO UPDATE SET visit_count = visit_count + 1,
+                  students = students + excluded.students,
+                  teachers = teachers + excluded.teachers,
+                  parents = parents + excluded.parents;
+END;
+"""
+
+# Attendance columns on visits, summed into both rollups
+ATTENDANCE_COLUMNS = ("students", "teachers", "parents")
+
+# The triggers that maintain each rollup table
+ROLLUP_TRIGGERS = {
+    "visit_daily_rollup": ("visits_rollup_ai", "visits_rollup_ad", "visits_rollup_au"),
+    "partner_daily_rollup": (
+        "visits_partner_rollup_ai", "visits_partner_rollup_ad", "visits_partner_rollup_au",
+    ),
+}
+
+
+# Visits (and attendance) per partner per day, for the partner reports:
+# ranking partners or totalling one partner reads this (partners x days)
+# instead of every visit.
+PARTNER_ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS partner_daily_rollup (
+    partner_id  INTEGER NOT NULL,
+    visit_date  TEXT    NOT NULL,
+    visit_count INTEGER NOT NULL DEFAULT 0,
+    students    INTEGER NOT NULL DEFAULT 0,
+    teachers    INTEGER NOT NULL DEFAULT 0,
+    parents     INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (partner_id, visit_date)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_partner_rollup_date
+    ON partner_daily_rollup (visit_date, partner_id, visit_count);
+
+CREATE TRIGGER IF NOT EXISTS visits_partner_rollup_ai
+AFTER INSERT ON visits WHEN new.partner_id IS NOT NULL BEGIN
+    INSERT INTO partner_daily_rollup
+        (partner_id, visit_date, visit_count, students, teachers, parents)
+    VALUES (new.partner_id, new.visit_date, 1,
+            IFNULL(new.students, 0), IFNULL(new.teachers, 0), IFNULL(new.parents, 0))
+    ON CONFLICT (partner_id, visit_date)
+    DO UPDATE SET visit_count = visit_count + 1,
+                  students = students + excluded.students,
+                  teachers = teachers + excluded.teachers,
+                  parents = parents + excluded.parents;
+END;
+
+CREATE TRIGGER IF NOT EXISTS visits_partner_rollup_ad
+AFTER DELETE ON visits WHEN old.partner_id IS NOT NULL BEGIN
+    UPDATE partner_daily_rollup
+    SET visit_count = visit_count - 1,
+        students = students - IFNULL(old.students, 0),
+        teachers = teachers - IFNULL(old.teachers, 0),
+        parents = parents - IFNULL(old.parents, 0)
+    WHERE partner_id = old.partner_id AND visit_date = old.visit_date;
+    DELETE FROM partner_daily_rollup
+    WHERE partner_id = old.partner_id AND visit_date = old.visit_date AND visit_count <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS visits_partner_rollup_au
+AFTER UPDATE OF visit_date, partner_id, students, teachers, parents ON visits BEGIN
+    UPDATE partner_daily_rollup
+    SET visit_count = visit_count - 1,
+        students = students - IFNULL(old.students, 0),
+        teachers = teachers - IFNULL(old.teachers, 0),
+        parents = parents - IFNULL(old.parents, 0)
+    WHERE old.partner_id IS NOT NULL
+      AND partner_id = old.partner_id AND visit_date = old.visit_date;
+    DELETE FROM partner_daily_rollup
+    WHERE old.partner_id IS NOT NULL
+      AND partner_id = old.partner_id AND visit_date = old.visit_date AND visit_count <= 0;
+    INSERT INTO partner_daily_rollup
+        (partner_id, visit_date, visit_count, students, teachers, parents)
+    SELECT new.partner_id, new.visit_date, 1,
+           IFNULL(new.students, 0), IFNULL(new.teachers, 0), IFNULL(new.parents, 0)
+    WHERE new.partner_id IS NOT NULL
+    ON CONFLICT (partner_id, visit_date)
+    DO UPDATE SET visit_count = visit_count + 1,
+                  students = students + excluded.students,
+                  teachers = teachers + excluded.teachers,
+                  parents = parents + excluded.parents;
+END;
+
+CREATE TRIGGER IF NOT EXISTS partners_unlink_ad AFTER DELETE ON partners BEGIN
+    UPDATE visits SET partner_id = NULL WHERE partner_id = old.id;
+END;
+"""
+
+
+def rebuild_visit_rollups(conn):
+    """Recomputes the visit rollup tables from scratch (backfill / repair)."""
+    conn.execute("DELETE FROM visit_daily_rollup")
+    conn.execute(
+        """
+        INSERT INTO visit_daily_rollup
+            (visit_date, school_id, status, visit_count, students, teachers, parents)
+        SELECT visit_date, school_id, IFNULL(status, ''), COUNT(*),
+               IFNULL(SUM(students), 0), IFNULL(SUM(teachers), 0), IFNULL(SUM(parents), 0)
+        FROM visits
+        GROUP BY visit_date, school_id, IFNULL(status, '')
+        """
+    )
+    conn.execute("DELETE FROM partner_daily_rollup")
+    conn.execute(
+        """
+        INSERT INTO partner_daily_rollup
+            (partner_id, visit_date, visit_count, students, teachers, parents)
+        SELECT partner_id, visit_date, COUNT(*),
+               IFNULL(SUM(students), 0), IFNULL(SUM(teachers), 0), IFNULL(SUM(parents), 0)
+        FROM visits
+        WHERE partner_id IS NOT NULL
+        GROUP BY partner_id, visit_date
+        """
+    )
+    conn.commit()
+
+
+def ensure_visit_rollups(conn):
+    exists = {
+        r["name"]
+        for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND name IN ('visit_daily_rollup', 'partner_daily_rollup')"
+        )
+    }
+    rebuild = len(exists) < 2
+
+    # Rollups from before attendance was tracked: add the sums and replace
+    # the triggers (CREATE TRIGGER IF NOT EXISTS would keep the old ones)
+    for table in exists:
+        rollup_columns = {r["name"] for r in conn.execute(f"PRAGMA table_info({table})")}
+        missing = [c for c in ATTENDANCE_COLUMNS if c not in rollup_columns]
+        if missing:
+            for column in missing:
+                conn.execute(
+                    f"ALTER TABLE {table} ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0"
+                )
+            for trigger in ROLLUP_TRIGGERS[table]:
+                conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            rebuild = True
+
+    conn.executescript(VISIT_ROLLUP_SCHEMA)
+    conn.executescript(PARTNER_ROLLUP_SCHEMA)
+    if rebuild:
+        rebuild_visit_rollups(conn)
+
+
+# School timetables, parsed out of the free-text start_time, end_time,
+# exam_dates and holidays fields whenever a school is saved, so
+# availability checks never have to re-parse them.
+AVAILABILITY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS school_hours (
+    school_id    INTEGER PRIMARY KEY,
+    start_minute INTEGER,
+    end_minute   INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS school_blackouts (
+    school_id     INTEGER NOT NULL,
+    blackout_date TEXT    NOT NULL,
+    reason        TEXT    NOT NULL,   -- 'exam' or 'holiday'
+    PRIMARY KEY (school_id, blackout_date, reason)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS schools_availability_ad AFTER DELETE ON schools BEGIN
+    DELETE FROM school_hours WHERE school_id = old.id;
+    DELETE FROM school_blackouts WHERE school_id = old.id;
+END;
+"""
+
+DEFAULT_DAY_START = 8 * 60    # used for schools without start/end times
+DEFAULT_DAY_END = 15 * 60
+FREE_SLOT_STEP_MINUTES = 30
+FREE_SLOTS_MAX_DAYS = 92
+
+
+def save_school_availability(conn, schools: List[Tuple[int, str, str, str, str]]):
+    """
+    Re-parses the timetable fields for these schools:
+    (school_id, start_time, end_time, exam_dates, holidays).
+    The caller commits, together with the school change itself.
+    """
+    ids = [(school[0],) for school in schools]
+    conn.executemany("DELETE FROM school_hours WHERE school_id = ?", ids)
+    conn.executemany("DELETE FROM school_blackouts WHERE school_id = ?", ids)
+
+    hours = []
+    blackouts = []
+    for school_id, start_time, end_time, exam_dates, holidays in schools:
+        hours.append((
+            school_id,
+            availability.parse_time(start_time),
+            availability.parse_time(end_time),
+        ))
+        for day in availability.parse_date_list(exam_dates):
+            blackouts.append((school_id, day.isoformat(), "exam"))
+        for day in availability.parse_date_list(holidays):
+            blackouts.append((school_id, day.isoformat(), "holiday"))
+
+    conn.executemany(
+        "INSERT INTO school_hours (school_id, start_minute, end_minute) VALUES (?, ?, ?)",
+        hours,
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO school_blackouts (school_id, blackout_date, reason) "
+        "VALUES (?, ?, ?)",
+        blackouts,
+    )
+
+
+def rebuild_school_availability(conn):
+    """Re-parses the timetable of every school (backfill / repair)."""
+    rows = conn.execute(
+        "SELECT id, start_time, end_time, exam_dates, holidays FROM schools"
+    ).fetchall()
+    save_school_availability(conn, [tuple(r) for r in rows])
+    conn.commit()
+
+
+def ensure_school_availability(conn):
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'school_hours'"
+    ).fetchone()
+    conn.executescript(AVAILABILITY_SCHEMA)
+    if not exists:
+        rebuild_school_availability(conn)
+
+
+def school_unavailable_reason(school_id: int, visit_date: date, visit_time: str) -> Optional[str]:
+    """
+    Why a school can't take a visit at this date and time (a weekend,
+    outside its stated hours, or an exam day / holiday), or None if it can.
+    Weekends are out for every school, as in find_free_slots.
+    """
+    if visit_date.weekday() >= 5:
+        return "a weekend"
+    conn = get_db_connection()
+    blackout = conn.execute(
+        "SELECT reason FROM school_blackouts WHERE school_id = ? AND blackout_date = ?",
+        (school_id, visit_date.isoformat()),
+    ).fetchone()
+    if blackout:
+        return "an exam day" if blackout["reason"] == "exam" else "a school holiday"
+
+    hours = conn.execute(
+        "SELECT start_minute, end_minute FROM school_hours WHERE school_id = ?",
+        (school_id,),
+    ).fetchone()
+    minute = availability.parse_time(visit_time)
+    if hours and minute is not None:
+        if hours["start_minute"] is not None and minute < hours["start_minute"]:
+            return "before the school day starts"
+        if hours["end_minute"] is not None and minute >= hours["end_minute"]:
+            return "after the school day ends"
+    return None
+
+
+def find_free_slots(
+    school_id: int, start_date: date, end_date: date, step: int = FREE_SLOT_STEP_MINUTES
+) -> Dict[str, List[str]]:
+    """
+    Free visit times for one school between two dates, by date.
+
+    Combines the school's hours, its exam days and holidays, and every
+    visit already booked (any school, since a slot can only be used once).
+    Three indexed queries no matter how long the range is.
+    """
+    conn = get_db_connection()
+    hours = conn.execute(
+        "SELECT start_minute, end_minute FROM school_hours WHERE school_id = ?",
+        (school_id,),
+    ).fetchone()
+    day_start = DEFAULT_DAY_START
+    day_end = DEFAULT_DAY_END
+    if hours and hours["start_minute"] is not None:
+        day_start = hours["start_minute"]
+    if hours and hours["end_minute"] is not None:
+        day_end = hours["end_minute"]
+
+    blackout_days = {
+        r["blackout_date"]
+        for r in conn.execute(
+            """
+            SELECT blackout_date FROM school_blackouts
+            WHERE school_id = ? AND blackout_date BETWEEN ? AND ?
+            """,
+            (school_id, start_date.isoformat(), end_date.isoformat()),
+        )
+    }
+    booked = {
+        day: {slot["time"] for slot in slots}
+        for day, slots in taken_slots(start_date, end_date).items()
+    }
+
+    day_times = [
+        availability.format_time(m) for m in range(day_start, day_end, max(step, 5))
+    ]
+    free: Dict[str, List[str]] = {}
+    day = start_date
+    while day <= end_date:
+        iso = day.isoformat()
+        if day.weekday() < 5 and iso not in blackout_days:
+            taken = booked.get(iso, set())
+            times = [t for t in day_times if t not in taken]
+            if times:
+                free[iso] = times
+        day += timedelta(days=1)
+    return free
+
+
+# Stand-in for uq_visits_date_time while old double bookings prevent it:
+# new conflicts are still rejected, with the same constraint error, so
+# schedule_visit's IntegrityError handling works either way.
+VISIT_SLOT_GUARD_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS visits_slot_guard_bi BEFORE INSERT ON visits
+WHEN EXISTS (SELECT 1 FROM visits
+             WHERE visit_date = new.visit_date AND visit_time = new.visit_time)
+BEGIN
+    SELECT RAISE(ABORT, 'UNIQUE constraint failed: visits.visit_date, visits.visit_time');
+END;
+
+CREATE TRIGGER IF NOT EXISTS visits_slot_guard_bu BEFORE UPDATE OF visit_date, visit_time ON visits
+WHEN EXISTS (SELECT 1 FROM visits
+             WHERE visit_date = new.visit_date AND visit_time = new.visit_time
+               AND id != new.id)
+BEGIN
+    SELECT RAISE(ABORT, 'UNIQUE constraint failed: visits.visit_date, visits.visit_time');
+END;
+"""
+
+
+def ensure_visit_slot_index(conn):
+    """Unique (visit_date, visit_time) index for databases made before it existed."""
+    try:
+        conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_visits_date_time "
+            "ON visits (visit_date, visit_time)"
+        )
+        # Once the duplicates are gone the index does the job
+        conn.execute("DROP TRIGGER IF EXISTS visits_slot_guard_bi")
+        conn.execute("DROP TRIGGER IF EXISTS visits_slot_guard_bu")
+        conn.execute("DROP INDEX IF EXISTS idx_visits_date_time")
+    except sqlite3.IntegrityError:
+        # Old data already has double-booked slots: keep lookups fast, and
+        # reject new double bookings with triggers instead
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_visits_date_time "
+            "ON visits (visit_date, visit_time)"
+        )
+        conn.executescript(VISIT_SLOT_GUARD_TRIGGERS)
+        app.logger.warning(
+            "visits has double-booked slots, so uq_visits_date_time could not "
+            "be created; new conflicts are rejected by triggers. Remove the "
+            "duplicates and restart to enforce it with the index."
+        )
+
+
+def ensure_schema():
+    """Creates any missing tables, indexes and triggers."""
+    conn = get_db_connection()
+    with open(SCHEMA_FILE, encoding="utf-8") as f:
+        conn.executescript(f.read())
+    # Older databases were created before schools had a location column
+    school_columns = {r["name"] for r in conn.execute("PRAGMA table_info(schools)")}
+    if "location" not in school_columns:
+        conn.execute("ALTER TABLE schools ADD COLUMN location TEXT")
+    conn.commit()
+
+    db.create_all()  # ORM tables (visits, feedback, partners) if they don't exist yet
+
+    # ...and visits from before partners and attendance existed
+    visit_columns = {r["name"] for r in conn.execute("PRAGMA table_info(visits)")}
+    if "partner_id" not in visit_columns:
+        conn.execute("ALTER TABLE visits ADD COLUMN partner_id INTEGER REFERENCES partners (id)")
+    for column in ATTENDANCE_COLUMNS:
+        if column not in visit_columns:
+            conn.execute(f"ALTER TABLE visits ADD COLUMN {column} INTEGER")
+    conn.commit()
+
+    conn.executescript(SCHEMA_EXTRAS)
+    for table in DATA_VERSION_TABLES:
+        conn.executescript(data_version_triggers(table))
+    ensure_search_indexes(conn)
+    ensure_visit_rollups(conn)
+    ensure_visit_slot_index(conn)
+    ensure_school_availability(conn)
+    conn.commit()
+
+
+def get_data_version(table: str, conn=None) -> int:
+    """Current write counter for `table` (changes whenever its rows change)."""
+    row = (conn or get_db_connection()).execute(
+        "SELECT version FROM data_versions WHERE table_name = ?", (table,)
+    ).fetchone()
+    return row["version"] if row else 0
+
+
+# ---------------------------
+# Conditional GET (ETag / Last-Modified)
+# ---------------------------
+# Pages built only from tables in data_versions can be revalidated with
+# one tiny query: the ETag is made from those tables' versions, so an
+# unchanged page is answered with 304 before the view even runs.
+# Changes to app.py (deploys) change the ETags too.
+ETAG_SALT = str(int(os.path.getmtime(__file__)))
+
+
+def data_version_stamp(tables: Tuple[str, ...]) -> Tuple[str, Optional[datetime]]:
+    """(versions as 'schools:12,visits:40', newest updated_at as UTC datetime)."""
+    rows = get_db_connection().execute(
+        "SELECT table_name, version, updated_at FROM data_versions "
+        "WHERE table_name IN (SELECT value FROM json_each(?))",
+        (json.dumps(tables),),
+    ).fetchall()
+    versions = {r["table_name"]: r["version"] for r in rows}
+    stamp = ",".join(f"{t}:{versions.get(t, 0)}" for t in tables)
+    updated = [r["updated_at"] for r in rows if r["updated_at"]]
+    last_modified = None
+    if updated:
+        last_modified = datetime.strptime(max(updated), "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    return stamp, last_modified
+
+
+def not_modified(etag: str, last_modified: Optional[datetime]) -> Response:
+    response = Response(status=304)
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def is_fresh(etag: str, last_modified: Optional[datetime]) -> bool:
+    """Does the browser's cached copy still match? (If-None-Match wins over If-Modified-Since.)"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    since = request.if_modified_since
+    return bool(since and last_modified and last_modified <= since)
+
+
+def conditional_on(*tables: str):
+    """
+    Decorator for GET pages that only depend on `tables`: adds ETag and
+    Last-Modified, and answers 304 without running the view when the
+    browser's copy is still current.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Pages with flashed messages are one-offs; don't validate them
+            if request.method != "GET" or session.get("_flashes"):
+                return view(*args, **kwargs)
+
+            stamp, last_modified = data_version_stamp(tables)
+            etag = hashlib.sha1(
+                "|".join([ETAG_SALT, stamp, request.full_path, str(session.get("username"))]).encode("utf-8")
+            ).hexdigest()
+            if is_fresh(etag, last_modified):
+                return not_modified(etag, last_modified)
+
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+                if last_modified:
+                    response.last_modified = last_modified
+                response.headers["Cache-Control"] = "private, no-cache"
+                response.vary.add("Cookie")
+            return response
+        return wrapper
+    return decorator
+
+
+# ---------------------------
+# Startup
+# ---------------------------
+# Nothing runs at import, so scripts and the CLI can import app without
+# migrating the database or starting threads. A serving process starts up
+# on its first request (the debug reloader's parent never serves one, so
+# it starts nothing); `flask init-db` applies the schema ahead of time.
+_started = False
+_start_lock = threading.Lock()
+
+
+def init_app():
+    """
+    Once per process: brings the schema up to date, re-queues report jobs
+    a previous process left unfinished, and starts the report sweeper and
+    the feedback writer.
+    """
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        with app.app_context():
+            ensure_schema()
+            resume_report_jobs()
+        if REPORT_SWEEPER_ENABLED:
+            start_report_sweeper()
+        if FEEDBACK_BUFFER_ENABLED:
+            start_feedback_writer()
+        _started = True
+
+
+@app.before_request
+def init_app_before_first_request():
+    if not _started:
+        init_app()
+
+
+@app.cli.command("init-db")
+def init_db_command():
+    """Creates or migrates the schema, indexes, triggers and rollups."""
+    ensure_schema()
+    click.echo("Database schema is up to date.")
+
+
+@app.cli.command("rebuild-availability")
+def rebuild_availability_command():
+    """Re-parses every school's hours, exam dates and holidays."""
+    rebuild_school_availability(get_db_connection())
+    click.echo("School availability rebuilt.")
+
+
+@app.cli.command("backfill-attendance")
+@click.argument("csv_file", type=click.Path(exists=True, dir_okay=False))
+def backfill_attendance_command(csv_file):
+    """
+    Loads attendance for past visits from a CSV with the columns
+    visit_id, students, teachers, parents (blank = unknown). Only visits
+    that are already Completed are updated; the rollup triggers keep the
+    report sums in step, all in one transaction.
+    """
+    rows = []
+    skipped = 0
+    with open(csv_file, newline="", encoding="utf-8-sig") as f:
+        for record in csv.DictReader(f):
+            try:
+                values = [
+                    int(record[c]) if (record.get(c) or "").strip() else None
+                    for c in ATTENDANCE_COLUMNS
+                ]
+                rows.append((*values, int(record["visit_id"])))
+            except (KeyError, ValueError):
+                skipped += 1
+
+    conn = get_db_connection()
+    cur = conn.executemany(
+        """
+        UPDATE visits
+        SET students = IFNULL(?, students), teachers = IFNULL(?, teachers),
+            parents = IFNULL(?, parents)
+        WHERE id = ? AND status = 'Completed'
+        """,
+        rows,
+    )
+    conn.commit()
+    click.echo(f"Updated {cur.rowcount} visits "
+               f"({len(rows)} rows read, {skipped} unreadable rows skipped).")
+
+
+@app.cli.command("rebuild-rollups")
+def rebuild_rollups_command():
+    """Rebuilds the visit rollup table from the visits table."""
+    rebuild_visit_rollups(get_db_connection())
+    click.echo("Visit rollups rebuilt.")
+
+
 # ---------------------------
 # Check if form data is valid
 # ---------------------------
@@ -261,6 +2227,7 @@ def validate_school_form(form):
             if capacity < 0:
                 errors["capacity"] = "Capacity cannot be negative."
         except ValueError:
+            capacity = None
             errors["capacity"] = "Capacity must be a whole number."
 
     # Number of teachers validation
@@ -273,6 +2240,7 @@ def validate_school_form(form):
             if num_teachers < 0:
                 errors["num_teachers"] = "Number of teachers cannot be negative."
         except ValueError:
+            num_teachers = None
             errors["num_teachers"] = "Number of teachers must be a whole number."
 
     # Email check (basic)
@@ -346,40 +2314,251 @@ def logout():
 # ORIGINAL ROUTES (Protection Added)
 # ========================================
 
+# ---------------------------
+# School lookup cache
+# ---------------------------
+# id / name / location of every school, for pick lists and autocomplete.
+# Rebuilt only when the schools data version changes (the triggers on
+# schools bump it on every insert, update and delete), so add, edit and
+# delete show up right away, in every worker.
+SCHOOL_AUTOCOMPLETE_LIMIT = 10
+SCHOOL_AUTOCOMPLETE_MAX_LIMIT = 50
+
+_school_lookup: Dict[str, Any] = {"version": None, "schools": [], "by_id": {}, "keys": []}
+_school_lookup_lock = threading.Lock()
+
+
+def school_name_key(name: str) -> str:
+    """
+    Case-insensitive form of a school name. Done in Python, not with SQLite's
+    LOWER(), which only folds ASCII letters ("École" stays "École").
+    """
+    return name.strip().lower()
+
+
+def school_lookup() -> Dict[str, Any]:
+    """
+    The cached school projections:
+      schools: [{"id", "name", "location"}] sorted by name (case-insensitive)
+      by_id:   id -> the same dicts
+      keys:    school_name_key() of each name, parallel to schools (for bisect)
+    """
+    global _school_lookup
+    version = get_data_version("schools")
+    lookup = _school_lookup
+    if lookup["version"] == version:
+        return lookup
+
+    with _school_lookup_lock:
+        if _school_lookup["version"] == version:  # another thread rebuilt it
+            return _school_lookup
+        rows = get_db_connection().execute("SELECT id, name, location FROM schools").fetchall()
+        schools = [{"id": r["id"], "name": r["name"], "location": r["location"]} for r in rows]
+        # Sorted by the same key the lookups bisect on
+        schools.sort(key=lambda s: (school_name_key(s["name"]), s["id"]))
+        # Swapped in whole, so readers never see half-built lists
+        _school_lookup = {
+            "version": version,
+            "schools": schools,
+            "by_id": {s["id"]: s for s in schools},
+            "keys": [school_name_key(s["name"]) for s in schools],
+        }
+        return _school_lookup
+
+
+def schools_with_prefix(prefix: str, limit: int) -> List[Dict[str, Any]]:
+    """Schools whose name starts with `prefix` (case-insensitive), by name."""
+    lookup = school_lookup()
+    keys = lookup["keys"]
+    prefix = school_name_key(prefix)
+    matches = []
+    index = bisect.bisect_left(keys, prefix)
+    while index < len(keys) and len(matches) < limit and keys[index].startswith(prefix):
+        matches.append(lookup["schools"][index])
+        index += 1
+    return matches
+
+
+def find_school_by_name(name: str) -> Optional[Dict[str, Any]]:
+    """Exact (case-insensitive) name match from the cache."""
+    lookup = school_lookup()
+    key = school_name_key(name)
+    index = bisect.bisect_left(lookup["keys"], key)
+    if key and index < len(lookup["keys"]) and lookup["keys"][index] == key:
+        return lookup["schools"][index]
+    return None
+
+
+@app.route("/schools/autocomplete")
+def school_autocomplete():
+    """
+    Prefix search on school names for the pick lists, e.g.
+    /schools/autocomplete?q=whit → [{"id": 5, "name": "Whitfield ...", "location": ...}]
+    Public, because the public feedback form uses it.
+    """
+    limit = parse_page_size(
+        request.args.get("limit"), SCHOOL_AUTOCOMPLETE_LIMIT, SCHOOL_AUTOCOMPLETE_MAX_LIMIT
+    )
+    prefix = request.args.get("q", "")
+    matches = schools_with_prefix(prefix, limit) if prefix.strip() else []
+    response = app.json.response(matches)
+    response.headers["Cache-Control"] = "private, max-age=60"
+    return response
+
+
+# ---------------------------
+# School list paging helpers
+# ---------------------------
+SCHOOLS_PAGE_SIZE = 25       # default rows per page on /schools
+SCHOOLS_MAX_PAGE_SIZE = 200
+
+# search term -> (schools data version, total count)
+_school_count_cache: Dict[str, Tuple[int, int]] = {}
+
+
+def school_search_condition(search_term: str) -> Tuple[str, List[Any]]:
+    """
+    WHERE condition (and params) for the school search box. Uses the
+    schools_fts index (name, address, contact person) when available.
+    """
+    match = fts_match_query(search_term) if FTS_ENABLED else None
+    if match:
+        return "id IN (SELECT rowid FROM schools_fts WHERE schools_fts MATCH ?)", [match]
+    return "name LIKE ?", [f"%{search_term}%"]
+
+
+def count_schools(search_term: str) -> int:
+    """
+    Total number of schools matching the search, cached until the
+    schools table changes (see data_versions).
+    """
+    version = get_data_version("schools")
+    cached = _school_count_cache.get(search_term)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    conn = get_db_connection()
+    if search_term:
+        condition, params = school_search_condition(search_term)
+        row = conn.execute(
+            f"SELECT COUNT(*) AS total FROM schools WHERE {condition}", params
+        ).fetchone()
+    else:
+        row = conn.execute("SELECT COUNT(*) AS total FROM schools").fetchone()
+
+    if len(_school_count_cache) >= 256:
+        _school_count_cache.clear()
+    _school_count_cache[search_term] = (version, row["total"])
+    return row["total"]
+
+
+def parse_iso_date(value: Optional[str]) -> Optional[date]:
+    """Parses YYYY-MM-DD, returning None for empty or invalid values."""
+    value = str(value or "").strip()
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def parse_page_size(value: Optional[str], default: int, maximum: int) -> int:
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
+
+
 # ---------------------------
 # Show list of all schools
 # ---------------------------
 @app.route("/schools")
 @login_required  # ADDED
+@conditional_on("schools")
 def list_schools():
+    """
+    Lists schools one page at a time using keyset pagination on (name, id),
+    so page 50 costs the same as page 1 (no OFFSET scanning).
+
+    Query args:
+        search      - words from the name, address or contact person
+        per_page    - rows per page (default SCHOOLS_PAGE_SIZE)
+        after_name / after_id   - cursor for the next page
+        before_name / before_id - cursor for the previous page
+    """
     search_term = request.args.get("search", "").strip()
+    per_page = parse_page_size(
+        request.args.get("per_page"), SCHOOLS_PAGE_SIZE, SCHOOLS_MAX_PAGE_SIZE
+    )
+    after_name = request.args.get("after_name")
+    after_id = request.args.get("after_id", type=int)
+    before_name = request.args.get("before_name")
+    before_id = request.args.get("before_id", type=int)
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    conditions = []
+    params: List[Any] = []
 
     if search_term:
-        cursor.execute(
-            """
-            SELECT id, name, address, contact_person
-            FROM schools
-            WHERE name LIKE ?
-            ORDER BY name ASC
-            """,
-            (f"%{search_term}%",),
-        )
+        condition, condition_params = school_search_condition(search_term)
+        conditions.append(condition)
+        params.extend(condition_params)
+
+    backwards = before_name is not None and before_id is not None
+    if backwards:
+        conditions.append("(name, id) < (?, ?)")
+        params.extend([before_name, before_id])
+        order = "name DESC, id DESC"
     else:
-        cursor.execute(
-            """
-            SELECT id, name, address, contact_person
-            FROM schools
-            ORDER BY name ASC
-            """
-        )
+        if after_name is not None and after_id is not None:
+            conditions.append("(name, id) > (?, ?)")
+            params.extend([after_name, after_id])
+        order = "name ASC, id ASC"
+
+    where_clause = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    # Fetch one extra row to know whether there is another page
+    cursor.execute(
+        f"""
+        SELECT id, name, address, contact_person
+        FROM schools
+        {where_clause}
+        ORDER BY {order}
+        LIMIT ?
+        """,
+        params + [per_page + 1],
+    )
 
     schools = cursor.fetchall()
-    conn.close()
+    has_more = len(schools) > per_page
+    schools = schools[:per_page]
+    if backwards:
+        schools.reverse()
+
+    is_first_page = (backwards and not has_more) or (
+        not backwards and after_id is None
+    )
+    is_last_page = not backwards and not has_more
+
+    next_args = prev_args = None
+    if schools and not is_last_page:
+        next_args = {"after_name": schools[-1]["name"], "after_id": schools[-1]["id"]}
+    if schools and not is_first_page:
+        prev_args = {"before_name": schools[0]["name"], "before_id": schools[0]["id"]}
 
-    return render_template("schools_list.html", schools=schools, search=search_term)
+    return render_template(
+        "schools_list.html",
+        schools=schools,
+        search=search_term,
+        per_page=per_page,
+        total_count=count_schools(search_term),
+        next_args=next_args,
+        prev_args=prev_args,
+    )
 
 
 # ---------------------------
@@ -397,7 +2576,6 @@ def edit_school(school_id):
     school = cursor.fetchone()
 
     if school is None:
-        conn.close()
         flash("School not found.", "error")
         return redirect(url_for("list_schools"))
 
@@ -422,7 +2600,6 @@ def edit_school(school_id):
         # If errors → show form again with messages
         if not is_valid:
             flash("Please fix the errors below and try again.", "error")
-            conn.close()
             return render_template(
                 "edit_school.html",
                 school=school,
@@ -463,14 +2640,15 @@ def edit_school(school_id):
                 school_id,
             ),
         )
+        save_school_availability(
+            conn, [(school_id, start_time, end_time, exam_dates, holidays)]
+        )
         conn.commit()
-        conn.close()
 
         flash("School information updated successfully.", "success")
         return redirect(url_for("edit_school", school_id=school_id))
 
     # GET → show form with existing data
-    conn.close()
     return render_template(
         "edit_school.html",
         school=school,
@@ -496,14 +2674,12 @@ def delete_school(school_id):
     school = cursor.fetchone()
 
     if school is None:
-        conn.close()
         flash("School not found.", "error")
         return redirect(url_for("list_schools"))
 
     # Delete the school
     cursor.execute("DELETE FROM schools WHERE id = ?", (school_id,))
     conn.commit()
-    conn.close()
 
     flash("School deleted successfully.", "success")
     return redirect(url_for("list_schools"))
@@ -551,14 +2727,8 @@ def add_school():
             # --------------------------------------
             # CHECK FOR DUPLICATE SCHOOL BY NAME
             # --------------------------------------
-            check = cur.execute(
-                "SELECT id FROM schools WHERE LOWER(name) = LOWER(?)",
-                (name,)
-            ).fetchone()
-
-            if check:
+            if existing_school_names(conn, [name]):
                 flash("A school with this name already exists.", "error")
-                conn.close()
                 return render_template(
                     "add_school.html",
                     form_data=request.form,
@@ -583,9 +2753,11 @@ def add_school():
                   holidays,
                   num_teachers),
             )
+            save_school_availability(
+                conn, [(cur.lastrowid, start_time, end_time, exam_dates, holidays)]
+            )
 
             conn.commit()
-            conn.close()
             
             flash("School added successfully!", "success")
             return redirect(url_for("list_schools"))
@@ -598,55 +2770,641 @@ def add_school():
                            errors={},
                            )
 
+# ---------------------------
+# Bulk import schools from CSV
+# ---------------------------
+SCHOOL_IMPORT_COLUMNS = [
+    "name", "address", "contact_person", "contact_phone", "contact_email",
+    "capacity", "start_time", "end_time", "exam_dates", "holidays", "num_teachers",
+]
+
+
+def existing_school_names(conn, names: List[str]) -> set:
+    """
+    Which of these names are already in the database, as school_name_key()s,
+    in one query. Compares school_name_key() (registered on every connection
+    in configure_sqlite_connection), because SQLite's LOWER() only folds
+    ASCII and would miss "École" vs "école".
+    """
+    keys = sorted({school_name_key(name) for name in names})
+    return {
+        r["name_key"]
+        for r in conn.execute(
+            """
+            SELECT DISTINCT school_name_key(name) AS name_key FROM schools
+            WHERE school_name_key(name) IN (SELECT value FROM json_each(?))
+            """,
+            (json.dumps(keys),),
+        )
+    }
+
+
+@app.route("/schools/import", methods=["GET", "POST"])
+@login_required
+def import_schools():
+    """
+    Imports many schools from one CSV upload.
+
+    Every row goes through the same validate_school_form() rules as
+    add_school. Duplicate names (inside the file or already saved) are
+    rejected. All valid rows are inserted with one executemany in a single
+    transaction, and the page shows what happened to each row.
+    """
+    if request.method == "GET":
+        return render_template("import_schools.html", results=None,
+                               columns=SCHOOL_IMPORT_COLUMNS)
+
+    upload = request.files.get("csv_file")
+    if upload is None or upload.filename == "":
+        flash("Please choose a CSV file to import.", "error")
+        return redirect(url_for("import_schools"))
+
+    try:
+        text = io.TextIOWrapper(upload.stream, encoding="utf-8-sig")
+        rows = list(csv.DictReader(text))
+    except (UnicodeDecodeError, csv.Error) as e:
+        flash(f"Could not read the CSV file: {e}", "error")
+        return redirect(url_for("import_schools"))
+
+    # 1) Validate every row in one pass
+    results = []      # one dict per CSV row, shown on the page
+    to_insert = []    # (result, values) for rows that passed validation
+    seen_in_file = {}
+    for line_no, row in enumerate(rows, start=2):  # line 1 is the header
+        row = {k.strip(): (v or "") for k, v in row.items() if k}
+        (
+            is_valid,
+            errors,
+            name,
+            address,
+            contact_person,
+            contact_phone,
+            contact_email,
+            capacity,
+            start_time,
+            end_time,
+            exam_dates,
+            holidays,
+            num_teachers,
+        ) = validate_school_form(row)
+
+        result = {"line": line_no, "name": name, "errors": list(errors.values())}
+        results.append(result)
+
+        if name:
+            key = school_name_key(name)
+            if key in seen_in_file:
+                result["errors"].append(
+                    f"Duplicate of line {seen_in_file[key]} in this file."
+                )
+            else:
+                seen_in_file[key] = line_no
+
+        if not result["errors"]:
+            to_insert.append((result, (
+                name, address, contact_person, contact_phone, contact_email,
+                capacity, start_time, end_time, exam_dates, holidays, num_teachers,
+            )))
+
+    # 2) Duplicate check against the database and the insert share one
+    #    write transaction (BEGIN IMMEDIATE), so no other request can add
+    #    one of these names, or any school, in between
+    conn = get_db_connection()
+    accepted = []
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        existing = existing_school_names(conn, [values[0] for _, values in to_insert])
+        for result, values in to_insert:
+            if school_name_key(values[0]) in existing:
+                result["errors"].append("School name already exists.")
+            else:
+                accepted.append(values)
+                result["imported"] = True
+
+        # 3) Insert everything at once. We hold the write lock, so the new
+        #    ids are exactly the ones above the old maximum, in insert order
+        prior_max = conn.execute("SELECT IFNULL(MAX(id), 0) FROM schools").fetchone()[0]
+        conn.executemany(
+            """
+            INSERT INTO schools
+            (name, address, contact_person, contact_phone, contact_email,
+            capacity,  start_time, end_time, exam_dates, holidays, num_teachers)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            accepted,
+        )
+        new_ids = [
+            r[0] for r in conn.execute(
+                "SELECT id FROM schools WHERE id > ? ORDER BY id", (prior_max,)
+            )
+        ]
+        save_school_availability(conn, [
+            (school_id, values[6], values[7], values[8], values[9])
+            for school_id, values in zip(new_ids, accepted)
+        ])
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        flash(f"Database error: {str(e)}", "danger")
+        for result in results:
+            result.pop("imported", None)
+        accepted = []
+
+    if accepted:
+        flash(f"Imported {len(accepted)} of {len(results)} schools.", "success")
+    else:
+        flash("No schools were imported.", "error")
+
+    return render_template("import_schools.html", results=results,
+                           columns=SCHOOL_IMPORT_COLUMNS)
+
+
 # ---------------------------
 # Schedule School Visits
 # ---------------------------
-from sqlalchemy import and_
+VISITS_PAGE_SIZE = 50
+VISITS_MAX_PAGE_SIZE = 500
+
 
 @app.route('/visits', methods=['GET'])
 @login_required  # ADDED
+@conditional_on("visits", "schools")
 def list_visits():
-    visits = Visit.query.order_by(Visit.visit_date.desc()).all()
-    return render_template('visits/list.html', visits=visits)
+    """
+    Shows visits newest first, one page at a time.
+
+    The school for each visit is loaded in the same query (joinedload), so
+    the template's visit.school.name doesn't fire one query per row.
+    Paging uses (visit_date, id) cursors instead of OFFSET.
+
+    Query args:
+        start_date / end_date   - optional YYYY-MM-DD range
+        per_page                - rows per page (default VISITS_PAGE_SIZE)
+        after_date / after_id   - cursor for the next (older) page
+        before_date / before_id - cursor for the previous (newer) page
+    """
+    start_date = parse_iso_date(request.args.get('start_date'))
+    end_date = parse_iso_date(request.args.get('end_date'))
+    per_page = parse_page_size(
+        request.args.get('per_page'), VISITS_PAGE_SIZE, VISITS_MAX_PAGE_SIZE
+    )
+    after_date = parse_iso_date(request.args.get('after_date'))
+    after_id = request.args.get('after_id', type=int)
+    before_date = parse_iso_date(request.args.get('before_date'))
+    before_id = request.args.get('before_id', type=int)
+
+    query = Visit.query.options(joinedload(Visit.school))
+
+    if start_date:
+        query = query.filter(Visit.visit_date >= start_date)
+    if end_date:
+        query = query.filter(Visit.visit_date <= end_date)
+
+    key = db.tuple_(Visit.visit_date, Visit.id)
+    backwards = before_date is not None and before_id is not None
+    if backwards:
+        query = query.filter(key > (before_date, before_id))
+        query = query.order_by(Visit.visit_date.asc(), Visit.id.asc())
+    else:
+        if after_date is not None and after_id is not None:
+            query = query.filter(key < (after_date, after_id))
+        query = query.order_by(Visit.visit_date.desc(), Visit.id.desc())
+
+    # One extra row tells us whether there is another page
+    visits = query.limit(per_page + 1).all()
+    has_more = len(visits) > per_page
+    visits = visits[:per_page]
+    if backwards:
+        visits.reverse()
+
+    is_first_page = (backwards and not has_more) or (
+        not backwards and after_id is None
+    )
+    is_last_page = not backwards and not has_more
+
+    # Page links keep the current filters
+    filters = {'start_date': start_date, 'end_date': end_date, 'per_page': per_page}
+    next_args = prev_args = None
+    if visits and not is_last_page:
+        next_args = dict(filters, after_date=visits[-1].visit_date.isoformat(),
+                         after_id=visits[-1].id)
+    if visits and not is_first_page:
+        prev_args = dict(filters, before_date=visits[0].visit_date.isoformat(),
+                         before_id=visits[0].id)
+
+    return render_template(
+        'visits/list.html',
+        visits=visits,
+        start_date=start_date,
+        end_date=end_date,
+        per_page=per_page,
+        next_args=next_args,
+        prev_args=prev_args,
+    )
 
 
 @app.route('/visits/schedule', methods=['GET', 'POST'])
 @login_required  # ADDED
 def schedule_visit():
-    schools = School.query.all()
-
     if request.method == 'POST':
         school_id = request.form.get('school_id')
         date_str = request.form.get('visit_date')
         time_str = request.form.get('visit_time')
 
+        # Without JavaScript only the typed school name arrives
+        if not school_id and request.form.get('school_name'):
+            school = find_school_by_name(request.form['school_name'])
+            school_id = school["id"] if school else None
+
         if not school_id or not date_str or not time_str:
             flash('All fields are required.', 'error')
             return redirect(url_for('schedule_visit'))
 
         visit_date = datetime.strptime(date_str, '%Y-%m-%d').date()
 
-        # Conflict check (SRS: 3.3)
-        conflict = Visit.query.filter(
-            and_(Visit.visit_date == visit_date,
-                 Visit.visit_time == time_str)
-        ).first()
+        # One canonical HH:MM, so "10:00", "10:00:00" and "10:00 AM" are the
+        # same slot for the unique (visit_date, visit_time) index
+        minutes = availability.parse_time(time_str)
+        if minutes is None:
+            flash(f'"{time_str}" is not a valid time (use HH:MM).', 'error')
+            return redirect(url_for('schedule_visit'))
+        time_str = availability.format_time(minutes)
 
-        if conflict:
-            flash('Conflict: there is already a visit at this date and time.', 'error')
+        reason = school_unavailable_reason(int(school_id), visit_date, time_str)
+        if reason:
+            flash(f'The school is not available then: {visit_date} {time_str} is {reason}.', 'error')
             return redirect(url_for('schedule_visit'))
 
         new_visit = Visit(
             school_id=int(school_id),
             visit_date=visit_date,
-            visit_time=time_str
+            visit_time=time_str,
+            partner_id=request.form.get('partner_id', type=int),
         )
         db.session.add(new_visit)
-        db.session.commit()
+
+        # Conflict check (SRS: 3.3): the unique (visit_date, visit_time)
+        # index rejects the insert if the slot is taken, even when another
+        # worker booked it a moment ago.
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash('Conflict: there is already a visit at this date and time.', 'error')
+            return redirect(url_for('schedule_visit'))
+
         flash('Visit scheduled successfully!', 'success')
         return redirect(url_for('list_visits'))
 
-    return render_template('visits/schedule.html', schools=schools)
+    partners = get_db_connection().execute(
+        "SELECT id, name FROM partners ORDER BY name"
+    ).fetchall()
+    return render_template('visits/schedule.html', partners=partners)
+
+TAKEN_SLOTS_MAX_DAYS = 366
+
+
+def taken_slots(start_date: date, end_date: date) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Every booked slot between two dates (inclusive), grouped by date.
+    One query on the (visit_date, visit_time) index.
+    """
+    rows = get_db_connection().execute(
+        """
+        SELECT visit_date, visit_time, id, school_id
+        FROM visits
+        WHERE visit_date BETWEEN ? AND ?
+        ORDER BY visit_date, visit_time
+        """,
+        (start_date.isoformat(), end_date.isoformat()),
+    ).fetchall()
+
+    slots: Dict[str, List[Dict[str, Any]]] = {}
+    for r in rows:
+        slots.setdefault(r["visit_date"], []).append(
+            {"time": r["visit_time"], "visit_id": r["id"], "school_id": r["school_id"]}
+        )
+    return slots
+
+
+@app.route('/visits/taken_slots', methods=['GET'])
+@login_required
+def visit_taken_slots():
+    """JSON list of booked slots for ?start_date=YYYY-MM-DD&end_date=YYYY-MM-DD."""
+    start_date = parse_iso_date(request.args.get('start_date'))
+    end_date = parse_iso_date(request.args.get('end_date'))
+    if not start_date or not end_date or end_date < start_date:
+        return {"error": "start_date and end_date (YYYY-MM-DD) are required."}, 400
+    if (end_date - start_date).days >= TAKEN_SLOTS_MAX_DAYS:
+        return {"error": f"Date range can be at most {TAKEN_SLOTS_MAX_DAYS} days."}, 400
+
+    return {
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "slots": taken_slots(start_date, end_date),
+    }
+
+
+@app.route('/schools/<int:school_id>/free_slots', methods=['GET'])
+@login_required
+def school_free_slots(school_id):
+    """JSON free visit times for a school, ?start_date=...&end_date=...&step=30."""
+    start_date = parse_iso_date(request.args.get('start_date'))
+    end_date = parse_iso_date(request.args.get('end_date'))
+    step = request.args.get('step', FREE_SLOT_STEP_MINUTES, type=int)
+    if not start_date or not end_date or end_date < start_date:
+        return {"error": "start_date and end_date (YYYY-MM-DD) are required."}, 400
+    if (end_date - start_date).days >= FREE_SLOTS_MAX_DAYS:
+        return {"error": f"Date range can be at most {FREE_SLOTS_MAX_DAYS} days."}, 400
+
+    school = get_db_connection().execute(
+        "SELECT id, name FROM schools WHERE id = ?", (school_id,)
+    ).fetchone()
+    if school is None:
+        return {"error": "School not found."}, 404
+
+    return {
+        "school_id": school["id"],
+        "school_name": school["name"],
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "free_slots": find_free_slots(school_id, start_date, end_date, step),
+    }
+
+
+# ---------------------------
+# Batch / recurring visit scheduling
+# ---------------------------
+BATCH_MAX_SLOTS = 2000
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+
+def parse_weekday(value: Any) -> Optional[int]:
+    """0-6 (Monday = 0) or a day name like 'Tuesday' / 'tue'."""
+    text = str(value if value is not None else "").strip().lower()
+    if text.isdigit() and int(text) < 7:
+        return int(text)
+    for index, name in enumerate(WEEKDAYS):
+        if text and name.startswith(text[:3]):
+            return index
+    return None
+
+
+def expand_recurrence(rule: Dict[str, Any]) -> Tuple[List[Tuple[int, date, str]], Optional[str]]:
+    """
+    Turns a rule like "school 4, every 2nd Tuesday at 10:00 from
+    2026-01-06 to 2026-04-01" into individual (school_id, date, time)
+    slots. Returns (slots, error message).
+    """
+    try:
+        school_id = int(rule.get("school_id"))
+    except (TypeError, ValueError):
+        return [], "Recurring rule needs a school."
+    start_date = parse_iso_date(rule.get("start_date"))
+    end_date = parse_iso_date(rule.get("end_date"))
+    weekday = parse_weekday(rule.get("weekday"))
+    minutes = availability.parse_time(str(rule.get("time") or ""))
+    try:
+        every_weeks = max(1, int(rule.get("every_weeks") or 1))
+    except (TypeError, ValueError):
+        every_weeks = 1
+
+    if not start_date or not end_date or end_date < start_date:
+        return [], "Recurring rule needs a start and end date."
+    if weekday is None:
+        return [], "Recurring rule needs a weekday."
+    if minutes is None:
+        return [], "Recurring rule needs a time (HH:MM)."
+    time_str = availability.format_time(minutes)
+
+    day = start_date + timedelta(days=(weekday - start_date.weekday()) % 7)
+    slots = []
+    while day <= end_date and len(slots) <= BATCH_MAX_SLOTS:
+        slots.append((school_id, day, time_str))
+        day += timedelta(weeks=every_weeks)
+    return slots, None
+
+
+def parse_slot_lines(text: str) -> Tuple[List[Tuple[int, date, str]], List[Dict[str, Any]]]:
+    """
+    Explicit slots, one per line: "school_id, YYYY-MM-DD, HH:MM".
+    Returns (slots, results for lines that couldn't be read). Times come
+    back as canonical HH:MM, like every other slot in a batch.
+    """
+    slots = []
+    errors = []
+    for line_no, line in enumerate((text or "").splitlines(), start=1):
+        if not line.strip():
+            continue
+        parts = [p.strip() for p in line.split(",")]
+        visit_date = parse_iso_date(parts[1]) if len(parts) == 3 else None
+        minutes = availability.parse_time(parts[2]) if len(parts) == 3 else None
+        if len(parts) != 3 or not parts[0].isdigit() or visit_date is None or minutes is None:
+            errors.append({"line": line_no, "input": line.strip(), "status": "invalid",
+                           "message": "Expected: school_id, YYYY-MM-DD, HH:MM"})
+            continue
+        slots.append((int(parts[0]), visit_date, availability.format_time(minutes)))
+    return slots, errors
+
+
+def schedule_batch(candidates: List[Tuple[int, date, str]]) -> List[Dict[str, Any]]:
+    """
+    Schedules many visits at once and returns one result per candidate:
+    accepted, conflict (slot already booked), duplicate (same slot earlier
+    in this batch), unavailable (weekend / school hours / exams / holidays) or
+    invalid (unknown school). Times must already be canonical HH:MM
+    (parse_slot_lines / expand_recurrence), so one slot has one spelling.
+
+    All checks are set-based queries over the whole batch, and the write
+    lock is taken first (BEGIN IMMEDIATE), so nothing can book one of
+    these slots between the check and the insert.
+    """
+    conn = get_db_connection()
+    slot_keys = [[d.isoformat(), t] for _, d, t in candidates]
+    school_ids = sorted({school_id for school_id, _, _ in candidates})
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        booked = {
+            (r["visit_date"], r["visit_time"])
+            for r in conn.execute(
+                """
+                SELECT visit_date, visit_time FROM visits
+                WHERE (visit_date, visit_time) IN (
+                    SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]')
+                    FROM json_each(?)
+                )
+                """,
+                (json.dumps(slot_keys),),
+            )
+        }
+        known_schools = {
+            r["id"]
+            for r in conn.execute(
+                "SELECT id FROM schools WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(school_ids),),
+            )
+        }
+        hours = {
+            r["school_id"]: (r["start_minute"], r["end_minute"])
+            for r in conn.execute(
+                """
+                SELECT school_id, start_minute, end_minute FROM school_hours
+                WHERE school_id IN (SELECT value FROM json_each(?))
+                """,
+                (json.dumps(school_ids),),
+            )
+        }
+        blackouts = {
+            (r["school_id"], r["blackout_date"]): r["reason"]
+            for r in conn.execute(
+                """
+                SELECT school_id, blackout_date, reason FROM school_blackouts
+                WHERE (school_id, blackout_date) IN (
+                    SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]')
+                    FROM json_each(?)
+                )
+                """,
+                (json.dumps([[s, d.isoformat()] for s, d, _ in candidates]),),
+            )
+        }
+
+        results = []
+        accepted = []
+        in_batch = set()
+        for school_id, visit_date, time_str in candidates:
+            iso = visit_date.isoformat()
+            result = {"school_id": school_id, "visit_date": iso, "visit_time": time_str}
+            results.append(result)
+
+            minute = availability.parse_time(time_str)
+            start_minute, end_minute = hours.get(school_id, (None, None))
+            if school_id not in known_schools:
+                result.update(status="invalid", message="School not found.")
+            elif (iso, time_str) in booked:
+                result.update(status="conflict", message="Slot is already booked.")
+            elif (iso, time_str) in in_batch:
+                result.update(status="duplicate", message="Same slot appears earlier in this batch.")
+            elif visit_date.weekday() >= 5:
+                result.update(status="unavailable", message="Weekend.")
+            elif (school_id, iso) in blackouts:
+                reason = "Exam day." if blackouts[(school_id, iso)] == "exam" else "School holiday."
+                result.update(status="unavailable", message=reason)
+            elif minute is not None and start_minute is not None and minute < start_minute:
+                result.update(status="unavailable", message="Before the school day starts.")
+            elif minute is not None and end_minute is not None and minute >= end_minute:
+                result.update(status="unavailable", message="After the school day ends.")
+            else:
+                result.update(status="accepted", message="")
+                in_batch.add((iso, time_str))
+                accepted.append((school_id, iso, time_str, "Scheduled"))
+
+        conn.executemany(
+            "INSERT INTO visits (school_id, visit_date, visit_time, status) VALUES (?, ?, ?, ?)",
+            accepted,
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return results
+
+
+@app.route('/visits/schedule_batch', methods=['GET', 'POST'])
+@login_required
+def schedule_visit_batch():
+    """
+    Schedules many visits in one go, from explicit slots and/or recurring
+    rules. Accepts the HTML form, or JSON like:
+
+        {"slots": [{"school_id": 3, "visit_date": "2026-01-13", "visit_time": "10:00"}],
+         "rules": [{"school_id": 4, "weekday": "tuesday", "every_weeks": 2,
+                    "time": "10:00", "start_date": "2026-01-06", "end_date": "2026-04-01"}]}
+
+    and answers with one result per slot.
+    """
+    if request.method == 'GET':
+        return render_template('visits/batch.html', results=None, form_data={})
+
+    candidates: List[Tuple[int, date, str]] = []
+    problems: List[Dict[str, Any]] = []
+
+    if request.is_json:
+        payload = request.get_json(silent=True)
+        if payload is None:
+            payload = {}
+        if not isinstance(payload, dict):
+            return {"error": 'Expected {"slots": [...], "rules": [...]}.'}, 400
+        slot_list = payload.get("slots") or []
+        rules = payload.get("rules") or []
+        if not isinstance(slot_list, list) or not isinstance(rules, list):
+            return {"error": 'Expected {"slots": [...], "rules": [...]}.'}, 400
+
+        # Wrongly shaped entries fail the whole request, each one reported
+        malformed = [
+            {"line": index, "input": item, "status": "invalid",
+             "message": f"Each {kind} must be a JSON object."}
+            for kind, items in (("slot", slot_list), ("rule", rules))
+            for index, item in enumerate(items, start=1)
+            if not isinstance(item, dict)
+        ]
+        if malformed:
+            return {"error": "Malformed slots or rules.", "problems": malformed}, 400
+
+        for index, slot in enumerate(slot_list, start=1):
+            visit_date = parse_iso_date(slot.get("visit_date"))
+            minutes = availability.parse_time(str(slot.get("visit_time") or ""))
+            try:
+                school_id = int(slot.get("school_id"))
+            except (TypeError, ValueError):
+                school_id = None
+            if school_id is None or visit_date is None or minutes is None:
+                problems.append({"line": index, "input": slot, "status": "invalid",
+                                 "message": "Needs school_id, visit_date and visit_time."})
+            else:
+                candidates.append((school_id, visit_date, availability.format_time(minutes)))
+    else:
+        slots, problems = parse_slot_lines(request.form.get('slots', ''))
+        candidates.extend(slots)
+        rules = []
+        rule_school_id = request.form.get('rule_school_id')
+        if not rule_school_id and request.form.get('rule_school_name'):
+            school = find_school_by_name(request.form['rule_school_name'])
+            rule_school_id = school["id"] if school else "unknown"
+        if rule_school_id:
+            rules.append({
+                "school_id": rule_school_id,
+                "weekday": request.form.get('rule_weekday'),
+                "every_weeks": request.form.get('rule_every_weeks'),
+                "time": request.form.get('rule_time'),
+                "start_date": request.form.get('rule_start_date'),
+                "end_date": request.form.get('rule_end_date'),
+            })
+
+    for rule in rules:
+        slots, error = expand_recurrence(rule)
+        if error:
+            problems.append({"input": rule, "status": "invalid", "message": error})
+        candidates.extend(slots)
+
+    if len(candidates) > BATCH_MAX_SLOTS:
+        message = f"At most {BATCH_MAX_SLOTS} visits can be scheduled at once."
+        if request.is_json:
+            return {"error": message}, 400
+        flash(message, 'error')
+        return render_template('visits/batch.html', results=None, form_data=request.form)
+
+    results = schedule_batch(candidates) if candidates else []
+    accepted = sum(1 for r in results if r["status"] == "accepted")
+
+    if request.is_json:
+        return {"accepted": accepted, "results": results, "problems": problems}
+
+    flash(f'{accepted} of {len(results)} visits scheduled.', 'success' if accepted else 'error')
+    return render_template('visits/batch.html', results=results, problems=problems,
+                           form_data=request.form)
+
 
 @app.route('/visits/<int:visit_id>/delete', methods=['POST'])
 @login_required
@@ -661,6 +3419,80 @@ def delete_visit(visit_id):
     return redirect(url_for('list_visits'))
 
 
+@app.route('/visits/<int:visit_id>/complete', methods=['GET', 'POST'])
+@login_required
+def complete_visit(visit_id):
+    """Marks a visit Completed and records how many people came."""
+    visit = Visit.query.get_or_404(visit_id)
+
+    if request.method == 'POST':
+        counts = {}
+        errors = {}
+        for column in ATTENDANCE_COLUMNS:
+            value = request.form.get(column, '').strip()
+            try:
+                counts[column] = int(value) if value else 0
+                if counts[column] < 0:
+                    raise ValueError
+            except ValueError:
+                errors[column] = 'Enter a whole number (0 or more).'
+
+        if errors:
+            return render_template('visits/complete.html', visit=visit,
+                                   errors=errors, form_data=request.form)
+
+        visit.status = 'Completed'
+        for column, value in counts.items():
+            setattr(visit, column, value)
+        db.session.commit()  # the rollup triggers add the counts to the report sums
+
+        flash('Visit marked as completed.', 'success')
+        return redirect(url_for('list_visits'))
+
+    form_data = {c: getattr(visit, c) if getattr(visit, c) is not None else '' for c in ATTENDANCE_COLUMNS}
+    return render_template('visits/complete.html', visit=visit, errors={}, form_data=form_data)
+
+
+# ---------------------------
+# Partners
+# ---------------------------
+@app.route('/partners', methods=['GET', 'POST'])
+@login_required
+@conditional_on("partners", "visits")
+def list_partners():
+    """Partner organisations, with their all-time visit counts (from the rollup)."""
+    conn = get_db_connection()
+
+    if request.method == 'POST':
+        name = request.form.get('name', '').strip()
+        if not name:
+            flash('Partner name is required.', 'error')
+        elif conn.execute(
+            "SELECT 1 FROM partners WHERE LOWER(name) = LOWER(?)", (name,)
+        ).fetchone():
+            flash('A partner with this name already exists.', 'error')
+        else:
+            conn.execute(
+                "INSERT INTO partners (name, contact_person, contact_email) VALUES (?, ?, ?)",
+                (name, request.form.get('contact_person', '').strip() or None,
+                 request.form.get('contact_email', '').strip() or None),
+            )
+            conn.commit()
+            flash('Partner added.', 'success')
+        return redirect(url_for('list_partners'))
+
+    partners = conn.execute(
+        """
+        SELECT p.id, p.name, p.contact_person, p.contact_email,
+               IFNULL((SELECT SUM(visit_count) FROM partner_daily_rollup r
+                       WHERE r.partner_id = p.id), 0) AS visits
+        FROM partners p
+        ORDER BY p.name
+        """
+    ).fetchall()
+    return render_template('partners.html', partners=partners)
+
+
 # ---------------------------
 # Requirement 4: Summary Reports
 # ---------------------------
@@ -701,48 +3533,395 @@ def generate_report():
     school_id = parse_int("school_id")
     partner_id = parse_int("partner_id")
 
-    # Build summary based on filters
-    summary = fetch_summary(
-        report_type=report_type,
-        start_date=start_date,
-        end_date=end_date,
-        school_id=school_id,
-        partner_id=partner_id,
+    # Optional per-period / per-group breakdown (see fetch_time_series)
+    bucket = request.form.get("bucket") if request.form.get("bucket") in REPORT_BUCKETS else None
+    breakdown = request.form.get("breakdown") if request.form.get("breakdown") in REPORT_BREAKDOWNS else None
+
+    top_n = None
+    if report_type == "top_partners":
+        bucket = breakdown = None
+        top_n = max(1, min(parse_int("top_n") or REPORT_TOP_PARTNERS, REPORT_TOP_PARTNERS_MAX))
+
+    job_id = submit_report_job(
+        report_type, start_date, end_date, school_id, partner_id, bucket, breakdown, top_n
     )
+    return redirect(url_for("report_job", job_id=job_id))
 
-    # Write CSV version of this summary
-    output_path = write_csv(summary, report_type)
 
-    flash("Report generated successfully.", "success")
+def load_report_job(job_id: str) -> Optional[Dict[str, Any]]:
+    row = get_db_connection().execute(
+        "SELECT * FROM report_jobs WHERE id = ?", (job_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    job["summary"] = json.loads(job["summary"]) if job["summary"] else None
+    return job
+
+
+@app.route("/reports/jobs/<job_id>")
+@login_required
+def report_job(job_id: str):
+    """Shows a report job: a progress page while it runs, the report once done."""
+    job = load_report_job(job_id)
+    if job is None:
+        flash("Report not found.", "error")
+        return redirect(url_for("generate_report"))
+
+    if job["status"] != "done":
+        return render_template(
+            "report_job.html", job=job, poll_seconds=REPORT_JOB_POLL_SECONDS
+        )
+
+    # Same filters, for the row-level export links
+    export_args = {
+        key: value for key, value in job["params"].items()
+        if value is not None and key not in ("bucket", "breakdown", "top_n")
+    }
 
     return render_template(
         "report_result.html",
-        summary=summary,
-        report_file_name=output_path.name,
-        report_type=report_type,
+        summary=job["summary"],
+        report_file_name=job["filename"],
+        report_type=job["params"]["report_type"],
+        export_args=export_args,
+    )
+
+
+@app.route("/reports/jobs/<job_id>/status")
+@login_required
+def report_job_status(job_id: str):
+    """JSON status for polling: status, progress and the download link once done."""
+    job = load_report_job(job_id)
+    if job is None:
+        return {"error": "not found"}, 404
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "download_url": (
+            url_for("download_report", filename=job["filename"])
+            if job["status"] == "done" else None
+        ),
+    }
+
+
+# ---------------------------
+# Row-level visit export (streamed)
+# ---------------------------
+EXPORT_BATCH_SIZE = 1000   # rows fetched from SQLite per chunk
+
+EXPORT_COLUMNS = [
+    "visit_id", "visit_date", "visit_time", "status",
+    "school_id", "school_name", "school_address", "contact_person",
+]
+
+
+def iter_visit_export(conn, where_clause: str, params: List[Any], fmt: str):
+    """
+    Yields the export as text chunks, one per batch of rows, so memory use
+    stays the same no matter how many visits match. `conn` is a report
+    snapshot (open_report_snapshot) and is closed when the export ends.
+    """
+    try:
+        yield from visit_export_chunks(conn, where_clause, params, fmt)
+    finally:
+        conn.close()
+
+
+def visit_export_chunks(conn, where_clause: str, params: List[Any], fmt: str):
+    cur = conn.execute(
+        f"""
+        SELECT
+            visits.id          AS visit_id,
+            visits.visit_date  AS visit_date,
+            visits.visit_time  AS visit_time,
+            visits.status      AS status,
+            visits.school_id   AS school_id,
+            schools.name       AS school_name,
+            schools.address    AS school_address,
+            schools.contact_person AS contact_person
+        FROM visits
+        LEFT JOIN schools ON schools.id = visits.school_id
+        {where_clause}
+        ORDER BY visits.visit_date, visits.id
+        """,
+        params,
+    )
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        writer.writerow(EXPORT_COLUMNS)
+
+    while True:
+        rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+        if not rows:
+            break
+        for row in rows:
+            if fmt == "csv":
+                writer.writerow(tuple(row))
+            else:
+                buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, row))))
+                buffer.write("\n")
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()  # CSV header when there were no rows
+
+
+def gzip_chunks(chunks):
+    """Gzip-compresses a stream of text chunks on the fly."""
+    compressor = zlib.compressobj(wbits=31)  # 31 → gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@app.route("/reports/export")
+@login_required
+def export_visits():
+    """
+    Streams every visit that matches the report filters, joined with its
+    school, as CSV or JSON Lines. Nothing is written to REPORTS_DIR.
+
+    Query args: the /reports filters (report_type, start_date, end_date,
+    school_id, partner_id), plus format=csv|jsonl and gzip=1.
+    """
+    report_type = request.args.get("report_type", "by_date_range")
+    fmt = request.args.get("format", "csv")
+    if fmt not in ("csv", "jsonl"):
+        fmt = "csv"
+    compress = request.args.get("gzip") == "1"
+
+    where_clause, params = build_where_clause(
+        report_type,
+        parse_iso_date(request.args.get("start_date")),
+        parse_iso_date(request.args.get("end_date")),
+        request.args.get("school_id", type=int),
+        request.args.get("partner_id", type=int),
+    )
+
+    conn, data_as_of = open_report_snapshot()
+    chunks = iter_visit_export(conn, where_clause, params, fmt)
+    filename = f"visits_{report_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    if compress:
+        chunks = gzip_chunks(chunks)
+        filename += ".gz"
+        mimetype = "application/gzip"
+
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Data-As-Of": data_as_of,
+        },
     )
 
+@app.route("/reports/cache_stats")
+@login_required
+def report_cache_stats():
+    """Hit/miss counters for the report cache (this worker only)."""
+    return report_cache.stats()
+
 # ---------------------------
 # Requirement 6: Feedback page
 # ---------------------------
+# Submissions are queued and written in batches by one writer thread
+# ("group commit"), so a class submitting at once shares a few commits
+# instead of each paying its own fsync and waiting on the write lock.
+#   CDMS_FEEDBACK_BUFFER=0   write each submission directly, as before
+#   CDMS_FEEDBACK_DURABLE=1  the request waits until its batch is committed
+#                            (still grouped with concurrent submissions)
+FEEDBACK_BUFFER_ENABLED = os.environ.get("CDMS_FEEDBACK_BUFFER", "1") != "0"
+FEEDBACK_DURABLE = os.environ.get("CDMS_FEEDBACK_DURABLE", "0") == "1"
+FEEDBACK_QUEUE_MAX = 1000          # submissions held in memory before writing directly
+FEEDBACK_BATCH_SIZE = 100          # flush once this many are waiting...
+FEEDBACK_FLUSH_INTERVAL = 0.25     # ...or the oldest has waited this long (seconds)
+FEEDBACK_DURABLE_TIMEOUT = 10      # seconds a durable request waits for its commit
+FEEDBACK_BATCH_RETRIES = 2         # retries of a failed batch before writing row by row
+FEEDBACK_RETRY_DELAY = 0.1         # seconds before the first retry (doubles each time)
+
+FEEDBACK_INSERT = """
+    INSERT INTO feedback
+        (visit_id, "Name", "School_name", "Email", "Feedback", "TripDate", created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+class FeedbackWaiter:
+    """A durable request waiting for its batch, and whether the batch was committed."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.written = False
+
+
+feedback_queue: "queue.Queue[Tuple[Tuple[Any, ...], Optional[FeedbackWaiter]]]" = queue.Queue(
+    maxsize=FEEDBACK_QUEUE_MAX
+)
+feedback_flush_lock = threading.Lock()
+
+feedback_flush_seconds = metrics.registry.histogram(
+    "cdms_feedback_flush_seconds", "Time to write one batch of buffered feedback."
+)
+feedback_flush_size = metrics.registry.histogram(
+    "cdms_feedback_flush_batch_size", "Feedback rows per batch.", (), metrics.COUNT_BUCKETS
+)
+feedback_wait_seconds = metrics.registry.histogram(
+    "cdms_feedback_queue_wait_seconds", "Time from submission to commit."
+)
+metrics.registry.gauge(
+    "cdms_feedback_queue_depth", "Feedback submissions waiting to be written.", feedback_queue.qsize
+)
+
+
+def feedback_row(form: FeedbackForm) -> Tuple[Any, ...]:
+    return (
+        None,  # visit_id: or set a real visit ID later if you link it
+        form.Name.data,
+        form.School_name.data,
+        form.Email.data,
+        form.Feedback.data,
+        form.TripDate.data.isoformat(),
+        datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f"),  # same format as the ORM
+    )
+
+
+def write_feedback_batch(batch: List[Tuple[Tuple[Any, ...], Optional[FeedbackWaiter], float]]) -> bool:
+    """
+    Writes a batch in one transaction and wakes any request waiting on it.
+    A failed batch is retried a couple of times (e.g. the database was
+    busy), then written row by row, so one bad row can't drop the rest.
+    Each waiter is told whether its own row was committed; returns whether
+    every row was.
+    """
+    started = time.perf_counter()
+    rows = [row for row, _, _ in batch]
+    written = [False] * len(rows)
+    with feedback_flush_lock, app.app_context():
+        conn = get_db_connection()
+        for attempt in range(FEEDBACK_BATCH_RETRIES + 1):
+            if attempt:
+                time.sleep(FEEDBACK_RETRY_DELAY * 2 ** (attempt - 1))
+            try:
+                conn.executemany(FEEDBACK_INSERT, rows)
+                conn.commit()
+                written = [True] * len(rows)
+                break
+            except Exception:
+                conn.rollback()
+                app.logger.warning(
+                    "Feedback batch of %d failed (attempt %d)", len(rows), attempt + 1, exc_info=True
+                )
+        else:
+            for i, row in enumerate(rows):
+                try:
+                    conn.execute(FEEDBACK_INSERT, row)
+                    conn.commit()
+                    written[i] = True
+                except Exception:
+                    conn.rollback()
+                    app.logger.exception("Could not write feedback submission: %r", row)
+    finished = time.perf_counter()
+    if METRICS_ENABLED:
+        feedback_flush_seconds.observe(finished - started)
+        feedback_flush_size.observe(len(batch))
+        for _, _, queued_at in batch:
+            feedback_wait_seconds.observe(finished - queued_at)
+    for (_, waiter, _), row_written in zip(batch, written):
+        if waiter is not None:
+            waiter.written = row_written
+            waiter.done.set()
+    return all(written)
+
+
+def feedback_writer_loop():
+    while True:
+        row, waiter = feedback_queue.get()  # wait for the first submission
+        batch = [(row, waiter, time.perf_counter())]
+        deadline = time.perf_counter() + FEEDBACK_FLUSH_INTERVAL
+        # Someone waiting (durable mode) means flush now, with whatever else is queued
+        urgent = waiter is not None
+        while len(batch) < FEEDBACK_BATCH_SIZE:
+            wait = 0 if urgent else deadline - time.perf_counter()
+            try:
+                if wait > 0:
+                    row, waiter = feedback_queue.get(timeout=wait)
+                else:
+                    row, waiter = feedback_queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append((row, waiter, time.perf_counter()))
+            urgent = urgent or waiter is not None
+        write_feedback_batch(batch)
+
+
+def drain_feedback_queue():
+    """Writes whatever is still queued (at shutdown)."""
+    batch = []
+    while True:
+        try:
+            row, waiter = feedback_queue.get_nowait()
+        except queue.Empty:
+            break
+        batch.append((row, waiter, time.perf_counter()))
+    if batch:
+        write_feedback_batch(batch)
+
+
+def submit_feedback(row: Tuple[Any, ...]) -> bool:
+    """
+    Queues one submission. Returns True once the user can be told it was
+    saved: right away normally, after its batch committed in durable mode.
+    Returns False if the write failed or wasn't confirmed in time (the
+    caller tells the user to try again).
+    """
+    waiter = FeedbackWaiter() if FEEDBACK_DURABLE else None
+    try:
+        feedback_queue.put_nowait((row, waiter))
+    except queue.Full:
+        # The writer is behind: write this one ourselves instead of dropping it
+        return write_feedback_batch([(row, None, time.perf_counter())])
+    if waiter is None:
+        return True
+    return waiter.done.wait(FEEDBACK_DURABLE_TIMEOUT) and waiter.written
+
+
+def start_feedback_writer():
+    threading.Thread(target=feedback_writer_loop, name="feedback-writer", daemon=True).start()
+    atexit.register(drain_feedback_queue)
+
+
 @app.route("/feedback", methods=['GET', 'POST'])
 def feedback():
     form = FeedbackForm()
 
-    schools = School.query.order_by(School.name).all()
-    school_names = [s.name for s in schools]
-
     if form.validate_on_submit():
-        new_feedback = Feedback(
-            visit_id=None,  # or set a real visit ID later if you link it
-            Name=form.Name.data,
-            Email=form.Email.data,
-            School_name=form.School_name.data,
-            TripDate=form.TripDate.data,
-            Feedback=form.Feedback.data
-        )
-        db.session.add(new_feedback)
-        db.session.commit()
+        if FEEDBACK_BUFFER_ENABLED:
+            if not submit_feedback(feedback_row(form)):
+                flash('Sorry, your feedback could not be saved. Please try again.', 'error')
+                return redirect(url_for('feedback'))
+        else:
+            new_feedback = Feedback(
+                visit_id=None,  # or set a real visit ID later if you link it
+                Name=form.Name.data,
+                Email=form.Email.data,
+                School_name=form.School_name.data,
+                TripDate=form.TripDate.data,
+                Feedback=form.Feedback.data
+            )
+            db.session.add(new_feedback)
+            db.session.commit()
 
         flash(f'Feedback submitted successfully for {form.Name.data}!', 'success')
         return redirect(url_for('feedback'))
@@ -750,8 +3929,7 @@ def feedback():
     return render_template(
         'feedback.html',
         title='Feedback Form',
-        form=form,
-        school_names=school_names
+        form=form
     )
 
 
@@ -761,14 +3939,25 @@ def feedback():
 # ---------------------------
 @app.route("/feedback_db", methods=["GET"])
 @login_required
+@conditional_on("feedback")
 def feedback_db():
     search_query = request.args.get("search", "").strip()
+    sort = request.args.get("sort", "newest")
 
     # Base query
     query = Feedback.query
 
     # Apply search filter if present
-    if search_query:
+    match = fts_match_query(search_query) if (search_query and FTS_ENABLED) else None
+    if match:
+        # Full-text search over name, school name and feedback text
+        query = query.filter(
+            db.text(
+                "feedback.id IN "
+                "(SELECT rowid FROM feedback_fts WHERE feedback_fts MATCH :match)"
+            ).bindparams(match=match)
+        )
+    elif search_query:
         query = query.filter(
             db.or_(
                 Feedback.Name.ilike(f"%{search_query}%"),
@@ -779,10 +3968,24 @@ def feedback_db():
     # Order by newest first
     feedback_list = query.order_by(Feedback.created_at.desc()).all()
 
+    if match and sort == "relevance":
+        # bm25 ranking, with names weighted above the free-text feedback
+        rows = get_db_connection().execute(
+            """
+            SELECT rowid FROM feedback_fts
+            WHERE feedback_fts MATCH ?
+            ORDER BY bm25(feedback_fts, 5.0, 5.0, 1.0)
+            """,
+            (match,),
+        ).fetchall()
+        position = {r["rowid"]: i for i, r in enumerate(rows)}
+        feedback_list.sort(key=lambda fb: position.get(fb.id, len(position)))
+
     return render_template(
         "feedback_db.html",
         feedback_list=feedback_list,
-        search=search_query
+        search=search_query,
+        sort=sort,
     )
 
 @app.route("/feedback/<int:feedback_id>/delete", methods=["POST"])
@@ -800,22 +4003,275 @@ def delete_feedback(feedback_id):
 def download_report(filename: str):
     """Download a previously generated CSV report."""
     file_path = REPORTS_DIR / filename
-    if not file_path.exists():
+
+    # Report files never change once written (the name includes the data
+    # version), so the name itself is a strong ETag and a browser that
+    # already has the file gets a 304 without touching the database.
+    etag = hashlib.sha1(filename.encode("utf-8")).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    # Stored reports are looked up in the index; older timestamped
+    # reports from before the index existed are checked on disk.
+    conn = get_db_connection()
+    indexed = conn.execute(
+        "SELECT filename FROM report_files WHERE filename = ?", (filename,)
+    ).fetchone()
+    if indexed:
+        conn.execute(
+            "UPDATE report_files SET last_accessed = ? WHERE filename = ?",
+            (datetime.now().isoformat(timespec="seconds"), filename),
+        )
+        conn.commit()
+    elif not file_path.exists():
+        flash("Report file not found.", "error")
+        return redirect(url_for("generate_report"))
+
+    try:
+        response = send_file(
+            file_path,
+            as_attachment=True,
+            download_name=filename,
+            mimetype="text/csv",
+            etag=etag,
+            max_age=REPORT_DOWNLOAD_MAX_AGE,
+        )
+        response.cache_control.public = False
+        response.cache_control.private = True  # staff only
+        return response
+    except FileNotFoundError:  # swept away after the index lookup
         flash("Report file not found.", "error")
         return redirect(url_for("generate_report"))
 
-    return send_file(
-        file_path,
-        as_attachment=True,
-        download_name=filename,
-        mimetype="text/csv",
+
+# ---------------------------
+# Read-only JSON API
+# ---------------------------
+# /api/schools, /api/visits and /api/feedback, for dashboards and scripts.
+#
+#   fields=id,name      only these columns are selected (see API_RESOURCES)
+#   limit=100           rows per page (max API_MAX_LIMIT)
+#   cursor=...          next_cursor from the previous page
+#
+# plus the same filters as the HTML pages. Rows come straight from
+# sqlite3 (no ORM objects) and are dumped with compact json.dumps.
+API_DEFAULT_LIMIT = 100
+API_MAX_LIMIT = 1000
+
+# LEFT JOIN, so asking for school_name never changes which visits come back
+_SCHOOL_JOIN = "LEFT JOIN schools ON schools.id = visits.school_id"
+
+# Each field is (SQL expression, join it needs or None)
+API_RESOURCES: Dict[str, Dict[str, Any]] = {
+    "schools": {
+        "table": "schools",
+        "tables": ("schools",),
+        "fields": {
+            name: (f"schools.{name}", None)
+            for name in (
+                "id", "name", "address", "contact_person", "contact_phone",
+                "contact_email", "capacity", "location", "start_time", "end_time",
+                "exam_dates", "holidays", "num_teachers",
+            )
+        },
+        "default_fields": ["id", "name", "address", "contact_person", "location", "capacity"],
+        "order": (["schools.name", "schools.id"], "ASC"),
+    },
+    "visits": {
+        "table": "visits",
+        "tables": ("visits", "schools"),
+        "fields": {
+            "id": ("visits.id", None),
+            "school_id": ("visits.school_id", None),
+            "school_name": ("schools.name", _SCHOOL_JOIN),
+            "partner_id": ("visits.partner_id", None),
+            "visit_date": ("visits.visit_date", None),
+            "visit_time": ("visits.visit_time", None),
+            "status": ("visits.status", None),
+            "students": ("visits.students", None),
+            "teachers": ("visits.teachers", None),
+            "parents": ("visits.parents", None),
+        },
+        "default_fields": ["id", "school_id", "school_name", "visit_date", "visit_time", "status"],
+        "order": (["visits.visit_date", "visits.id"], "DESC"),
+    },
+    "feedback": {
+        "table": "feedback",
+        "tables": ("feedback",),
+        "fields": {
+            "id": ("feedback.id", None),
+            "visit_id": ("feedback.visit_id", None),
+            "name": ('feedback."Name"', None),
+            "school_name": ('feedback."School_name"', None),
+            "email": ('feedback."Email"', None),
+            "feedback": ('feedback."Feedback"', None),
+            "trip_date": ('feedback."TripDate"', None),
+            "created_at": ("feedback.created_at", None),
+        },
+        "default_fields": ["id", "name", "school_name", "trip_date", "feedback", "created_at"],
+        "order": (["feedback.created_at", "feedback.id"], "DESC"),
+    },
+}
+
+
+def encode_cursor(values: List[Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Optional[List[Any]]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list):
+        return None
+    # Only plain values can be bound as SQL parameters
+    if not all(isinstance(v, (str, int, float)) and not isinstance(v, bool) for v in values):
+        return None
+    return values
+
+
+def api_filters(resource: str, args) -> Tuple[List[str], List[Any], Optional[str]]:
+    """
+    WHERE conditions for the filters each resource supports, matching
+    the HTML pages. Returns (conditions, params, error message).
+    """
+    conditions: List[str] = []
+    params: List[Any] = []
+    search = args.get("search", "").strip()
+
+    date_column = {"visits": "visits.visit_date", "feedback": 'feedback."TripDate"'}.get(resource)
+    if date_column:
+        for arg, op in (("start_date", ">="), ("end_date", "<=")):
+            if args.get(arg):
+                value = parse_iso_date(args.get(arg))
+                if value is None:
+                    return [], [], f"{arg} must be YYYY-MM-DD"
+                conditions.append(f"{date_column} {op} ?")
+                params.append(value.isoformat())
+
+    if resource == "schools" and search:
+        condition, search_params = school_search_condition(search)
+        conditions.append(condition)  # schools is queried without joins
+        params.extend(search_params)
+
+    elif resource == "visits":
+        if args.get("school_id"):
+            school_id = args.get("school_id", type=int)
+            if school_id is None:
+                return [], [], "school_id must be a number"
+            conditions.append("visits.school_id = ?")
+            params.append(school_id)
+        if args.get("partner_id"):
+            partner_id = args.get("partner_id", type=int)
+            if partner_id is None:
+                return [], [], "partner_id must be a number"
+            conditions.append("visits.partner_id = ?")
+            params.append(partner_id)
+        if args.get("status"):
+            conditions.append("visits.status = ?")
+            params.append(args["status"])
+
+    elif resource == "feedback" and search:
+        match = fts_match_query(search) if FTS_ENABLED else None
+        if match:
+            conditions.append("feedback.id IN (SELECT rowid FROM feedback_fts WHERE feedback_fts MATCH ?)")
+            params.append(match)
+        else:
+            conditions.append('(feedback."Name" LIKE ? OR feedback."School_name" LIKE ?)')
+            params.extend([f"%{search}%", f"%{search}%"])
+
+    return conditions, params, None
+
+
+def api_error(message: str, status: int = 400) -> Response:
+    return Response(json.dumps({"error": message}), status=status, mimetype="application/json")
+
+
+def api_page(resource: str) -> Response:
+    spec = API_RESOURCES[resource]
+
+    requested = request.args.get("fields")
+    fields = [f.strip() for f in requested.split(",") if f.strip()] if requested else spec["default_fields"]
+    unknown = [f for f in fields if f not in spec["fields"]]
+    if unknown:
+        return api_error(
+            f"unknown fields: {', '.join(unknown)} (available: {', '.join(spec['fields'])})"
+        )
+
+    conditions, params, error = api_filters(resource, request.args)
+    if error:
+        return api_error(error)
+
+    key_columns, direction = spec["order"]
+    if request.args.get("cursor"):
+        after = decode_cursor(request.args["cursor"])
+        if after is None or len(after) != len(key_columns):
+            return api_error("invalid cursor")
+        op = ">" if direction == "ASC" else "<"
+        conditions.append(f"({', '.join(key_columns)}) {op} ({', '.join('?' * len(after))})")
+        params.extend(after)
+
+    limit = parse_page_size(request.args.get("limit"), API_DEFAULT_LIMIT, API_MAX_LIMIT)
+    joins = sorted({spec["fields"][f][1] for f in fields if spec["fields"][f][1]})
+    # Key columns go last; they feed the cursor and are not returned unless asked for
+    columns = [spec["fields"][f][0] for f in fields] + key_columns
+    sql = (
+        f"SELECT {', '.join(columns)} FROM {spec['table']} {' '.join(joins)}"
+        + (f" WHERE {' AND '.join(conditions)}" if conditions else "")
+        + f" ORDER BY {', '.join(f'{c} {direction}' for c in key_columns)}"
+        + " LIMIT ?"
     )
+    rows = get_db_connection().execute(sql, (*params, limit + 1)).fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    n = len(fields)
+    data = [dict(zip(fields, tuple(row)[:n])) for row in rows]
+    next_cursor = encode_cursor(list(tuple(rows[-1])[n:])) if has_more else None
+
+    body = json.dumps({"data": data, "next_cursor": next_cursor}, separators=(",", ":"), default=str)
+    return Response(body, mimetype="application/json")
+
+
+def api_login_required(f):
+    """Like login_required, but answers 401 JSON instead of redirecting."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'logged_in' not in session:
+            return api_error("login required", 401)
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+@app.route("/api/schools")
+@api_login_required
+@conditional_on(*API_RESOURCES["schools"]["tables"])
+def api_schools():
+    """Schools by name. Filters: search."""
+    return api_page("schools")
+
+
+@app.route("/api/visits")
+@api_login_required
+@conditional_on(*API_RESOURCES["visits"]["tables"])
+def api_visits():
+    """Visits newest first. Filters: start_date, end_date, school_id, partner_id, status."""
+    return api_page("visits")
+
+
+@app.route("/api/feedback")
+@api_login_required
+@conditional_on(*API_RESOURCES["feedback"]["tables"])
+def api_feedback():
+    """Feedback newest first. Filters: search, start_date, end_date (trip date)."""
+    return api_page("feedback")
 
 
 # ---------------------------
 # Run the app
 # ---------------------------
 if __name__ == "__main__":
-    with app.app_context():
-        db.create_all()  # Create tables if they don't exist
-    app.run(debug=True)
+    app.run(debug=True)  # init_app() runs on the first request
@@ -0,0 +1,85 @@
+"""
+Parses the free-text timetable fields on a school (start_time, end_time,
+exam_dates, holidays) into structured values.
+
+Staff type these by hand, so the parser is forgiving: anything it can't
+read is skipped instead of raising an error.
+"""
+import re
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+TIME_FORMATS = ("%H:%M", "%H:%M:%S", "%I:%M %p", "%I:%M%p", "%I %p", "%I%p")
+
+DATE_FORMATS = (
+    "%Y-%m-%d",
+    "%d/%m/%Y",
+    "%d-%m-%Y",
+    "%B %d %Y",
+    "%b %d %Y",
+    "%d %B %Y",
+    "%d %b %Y",
+)
+
+# Longest range we expand into single days (guards against typos like 2205)
+MAX_RANGE_DAYS = 366
+
+# "2025-12-19 to 2026-01-05", "19/12/2025 - 05/01/2026", "... until ..."
+RANGE_SPLIT = re.compile(r"\s+(?:to|until|through|thru|-|–|—)\s+", re.IGNORECASE)
+ITEM_SPLIT = re.compile(r"[,;\n]+")
+
+
+def parse_time(value: Optional[str]) -> Optional[int]:
+    """'08:30' / '8:30 AM' → minutes since midnight, or None."""
+    value = (value or "").strip().upper()
+    if not value:
+        return None
+    for fmt in TIME_FORMATS:
+        try:
+            parsed = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        return parsed.hour * 60 + parsed.minute
+    return None
+
+
+def format_time(minutes: int) -> str:
+    """Minutes since midnight → 'HH:MM' (the format visit_time uses)."""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def parse_date(value: str) -> Optional[date]:
+    value = " ".join(value.replace(",", " ").split())
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def parse_date_list(text: Optional[str]) -> List[date]:
+    """
+    Every date mentioned in a free-text list of dates and date ranges,
+    e.g. "2025-06-09, 2025-06-10; 2025-12-19 to 2026-01-05".
+    Sorted, without duplicates.
+    """
+    days = set()
+    for item in ITEM_SPLIT.split(text or ""):
+        item = item.strip()
+        if not item:
+            continue
+
+        parts = RANGE_SPLIT.split(item, maxsplit=1)
+        if len(parts) == 2:
+            first, last = parse_date(parts[0]), parse_date(parts[1])
+            if first and last and first <= last and (last - first).days <= MAX_RANGE_DAYS:
+                for offset in range((last - first).days + 1):
+                    days.add(first + timedelta(days=offset))
+                continue
+
+        single = parse_date(item)
+        if single:
+            days.add(single)
+
+    return sorted(days)
@@ -0,0 +1,373 @@
+"""
+Route-level benchmarks for the CDMS Flask app.
+
+Drives the real routes through Flask's test client (logged in as admin)
+against generated databases of several sizes, and reports p50/p95/p99
+latency, throughput and SQL statements per request for each route.
+
+Results are saved as JSON so two runs can be compared:
+
+    python benchmark.py --sizes small,medium --out bench_before.json
+    ... change app.py ...
+    python benchmark.py --sizes small,medium --out bench_after.json --compare bench_before.json
+
+Databases are made with generate_data.py and kept in --data-dir, so
+later runs reuse them. Every run works on a fresh copy of them.
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from urllib.parse import urlsplit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# name: (schools, visits, feedback)
+DB_SIZES = {
+    "small": (200, 5_000, 1_000),
+    "medium": (2_000, 100_000, 20_000),
+    "large": (10_000, 1_000_000, 200_000),
+}
+DATA_SEED = 2140
+
+REGRESSION_THRESHOLD = 0.20  # flag routes whose p95 got 20% slower...
+MIN_REGRESSION_MS = 0.5      # ...and at least this much slower (ignores sub-ms noise)
+
+
+# ---------------------------
+# Routes to measure
+# ---------------------------
+def report_form(i):
+    """A different (but repeatable) date range per iteration."""
+    start = date(2020, 1, 6) + timedelta(days=(i * 37) % 1500)
+    return {
+        "report_type": "by_date_range",
+        "start_date": start.isoformat(),
+        "end_date": (start + timedelta(days=90)).isoformat(),
+    }
+
+
+SCHEDULE_SCHOOL_ID = 1
+SCHEDULE_FROM = date(2099, 1, 5)   # far in the future, so the slots are free
+schedule_slots = []                # (date, time), filled by load_schedule_slots()
+
+
+def load_schedule_slots(client, needed):
+    """
+    Asks the app for the school's free slots, so every POST is a real
+    booking: inside its hours and not on an exam day or holiday.
+    """
+    day = SCHEDULE_FROM
+    while len(schedule_slots) < needed:
+        if day > SCHEDULE_FROM + timedelta(days=3650):
+            raise RuntimeError(f"school {SCHEDULE_SCHOOL_ID} has too few free slots")
+        end = day + timedelta(days=27)
+        free = client.get(
+            f"/schools/{SCHEDULE_SCHOOL_ID}/free_slots"
+            f"?start_date={day.isoformat()}&end_date={end.isoformat()}&step=5"
+        ).get_json()["free_slots"]
+        for slot_date in sorted(free):
+            schedule_slots.extend((slot_date, slot_time) for slot_time in free[slot_date])
+        day = end + timedelta(days=1)
+
+
+def schedule_form(i):
+    """The next free slot (see load_schedule_slots)."""
+    slot_date, slot_time = schedule_slots.pop(0)
+    return {"school_id": str(SCHEDULE_SCHOOL_ID), "visit_date": slot_date,
+            "visit_time": slot_time}
+
+
+# name: (method, url, form builder or None)
+ROUTES = {
+    "list_schools": ("GET", "/schools", None),
+    "list_schools_search": ("GET", "/schools?search=high", None),
+    "list_visits": ("GET", "/visits", None),
+    "schedule_visit_get": ("GET", "/visits/schedule", None),
+    "schedule_visit_post": ("POST", "/visits/schedule", schedule_form),
+    "generate_report": ("POST", "/reports", report_form),
+    "feedback_db": ("GET", "/feedback_db", None),
+    "feedback_db_search": ("GET", "/feedback_db?search=planetarium", None),
+}
+
+# Where a successful POST redirects to; anything else (e.g. back to the
+# form with an error) stops the run instead of being timed as a success
+EXPECTED_REDIRECTS = {"schedule_visit_post": "/visits"}
+
+# POST /reports only queues a background job. For these routes the run
+# also waits for the job to finish, and reports the time until then as
+# "<route>_done", so jobs never overlap the routes timed after them.
+REPORT_JOB_ROUTES = {"generate_report"}
+REPORT_JOB_TIMEOUT = 120     # seconds
+REPORT_JOB_POLL = 0.005      # seconds between status checks
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def wait_for_report_job(client, job_url):
+    """Polls the job's status until it is done; raises if it failed or hung."""
+    deadline = time.perf_counter() + REPORT_JOB_TIMEOUT
+    while time.perf_counter() < deadline:
+        status = client.get(job_url + "/status").get_json()
+        if status["status"] == "done":
+            return
+        if status["status"] == "failed":
+            raise RuntimeError(f"report job failed: {status['error']}")
+        time.sleep(REPORT_JOB_POLL)
+    raise RuntimeError(f"report job {job_url} not done after {REPORT_JOB_TIMEOUT}s")
+
+
+def summarize(timings, statements):
+    timings.sort()
+    total_seconds = sum(timings) / 1000
+    return {
+        "requests": len(timings),
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+        "mean_ms": round(sum(timings) / len(timings), 3),
+        "throughput_rps": round(len(timings) / total_seconds, 1) if total_seconds else 0.0,
+        "sql_per_request": round(statements / len(timings), 2),
+    }
+
+
+# ---------------------------
+# One database (runs in a child process, because the app binds its
+# database path when it is imported)
+# ---------------------------
+def run_one(db_path, iterations, warmup, routes):
+    os.environ["CDMS_DATABASE"] = db_path
+    sys.path.insert(0, HERE)
+    import app as cdms
+    from sqlalchemy import event
+
+    # Count every statement on every pooled connection (ORM and sqlite3)
+    counter = {"statements": 0}
+
+    def trace(statement):
+        if not statement.startswith("--"):  # skip statements inside triggers
+            counter["statements"] += 1
+
+    def on_connect(dbapi_conn, connection_record):
+        dbapi_conn.set_trace_callback(trace)
+
+    cdms.init_app()  # schema and background threads, before anything is counted
+    with cdms.app.app_context():
+        event.listen(cdms.db.engine, "connect", on_connect)
+        cdms.db.engine.dispose()  # reconnect so every connection is traced
+
+    client = cdms.app.test_client()
+    client.post("/login", data={"username": "admin", "password": "admin123"})
+    if "schedule_visit_post" in routes:
+        load_schedule_slots(client, warmup + iterations)
+
+    results = {}
+    step = 0
+    for name in routes:
+        method, url, form = ROUTES[name]
+        timings = []
+        statements = 0
+        done_timings = []
+        done_statements = 0
+        for i in range(warmup + iterations):
+            step += 1
+            data = form(step) if form else None
+            counter["statements"] = 0
+            started = time.perf_counter()
+            if method == "GET":
+                response = client.get(url)
+            else:
+                response = client.post(url, data=data)
+            elapsed = time.perf_counter() - started
+            if response.status_code >= 400:
+                raise RuntimeError(f"{name}: HTTP {response.status_code}")
+            expected = EXPECTED_REDIRECTS.get(name)
+            if expected and urlsplit(response.location or "").path != expected:
+                raise RuntimeError(f"{name}: redirected to {response.location!r}, expected {expected}")
+            request_statements = counter["statements"]
+            if name in REPORT_JOB_ROUTES:
+                wait_for_report_job(client, response.location)
+                done_elapsed = time.perf_counter() - started
+            if i >= warmup:
+                timings.append(elapsed * 1000)
+                statements += request_statements
+                if name in REPORT_JOB_ROUTES:
+                    done_timings.append(done_elapsed * 1000)
+                    done_statements += counter["statements"]  # job + status polls
+
+        results[name] = summarize(timings, statements)
+        if done_timings:
+            results[f"{name}_done"] = summarize(done_timings, done_statements)
+    return results
+
+
+# ---------------------------
+# Orchestration
+# ---------------------------
+def ensure_database(data_dir, size):
+    schools, visits, feedback = DB_SIZES[size]
+    path = os.path.join(data_dir, f"bench_{size}_{DATA_SEED}.db")
+    if not os.path.exists(path):
+        print(f"Generating {size} database ({schools} schools, {visits} visits, {feedback} feedback)...")
+        subprocess.run(
+            [sys.executable, os.path.join(HERE, "generate_data.py"), "--db", path,
+             "--schools", str(schools), "--visits", str(visits),
+             "--feedback", str(feedback), "--seed", str(DATA_SEED)],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+    return path
+
+
+def copy_database(source_path, target_path):
+    """
+    Copies with the SQLite backup API: the databases are in WAL mode, and a
+    plain file copy would miss whatever is still in the -wal file.
+    """
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def check_database(db_path, size):
+    """Stops the run if the copy doesn't hold the generated data."""
+    expected = DB_SIZES[size][1]
+    conn = sqlite3.connect(db_path)
+    try:
+        found = conn.execute("SELECT COUNT(*) FROM visits").fetchone()[0]
+    except sqlite3.OperationalError:  # no visits table at all
+        found = 0
+    finally:
+        conn.close()
+    if found != expected:
+        sys.exit(f"{size} database has {found} visits instead of {expected}; "
+                 f"delete it from --data-dir so it is generated again")
+
+
+def run_size(template_path, size, args):
+    """Copies the template database and benchmarks it in a child process."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, os.path.basename(template_path))
+        copy_database(template_path, db_path)
+        check_database(db_path, size)
+        child = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run-one", db_path,
+             "--iterations", str(args.iterations), "--warmup", str(args.warmup),
+             "--routes", ",".join(args.routes)],
+            capture_output=True, text=True, cwd=tmp,
+        )
+    if child.returncode != 0:
+        sys.exit(f"Benchmark of {size} database failed:\n{child.stderr}")
+    return json.loads(child.stdout.strip().splitlines()[-1])
+
+
+def print_table(results):
+    header = f"{'size':<8} {'route':<22} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'sql/req':>8}"
+    print(header)
+    print("-" * len(header))
+    for size, routes in results.items():
+        for name, r in routes.items():
+            print(f"{size:<8} {name:<22} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+                  f"{r['p99_ms']:>9.2f} {r['throughput_rps']:>8.1f} {r['sql_per_request']:>8.1f}")
+
+
+def compare(old, new, threshold):
+    """Prints p95 changes and returns the list of regressions."""
+    regressions = []
+    print(f"\nComparison with previous run (p95, regression if > +{threshold:.0%}):")
+    for size, routes in new["results"].items():
+        for name, r in routes.items():
+            before = old.get("results", {}).get(size, {}).get(name)
+            if not before or not before["p95_ms"]:
+                continue
+            change = (r["p95_ms"] - before["p95_ms"]) / before["p95_ms"]
+            flag = ""
+            if change > threshold and r["p95_ms"] - before["p95_ms"] >= MIN_REGRESSION_MS:
+                flag = "  <-- REGRESSION"
+                regressions.append(f"{size}/{name}")
+            print(f"  {size:<8} {name:<22} {before['p95_ms']:>9.2f} -> {r['p95_ms']:>9.2f} "
+                  f"({change:+.0%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CDMS routes.")
+    parser.add_argument("--sizes", default="small,medium",
+                        help=f"comma-separated, from: {', '.join(DB_SIZES)}")
+    parser.add_argument("--routes", default=",".join(ROUTES),
+                        help="comma-separated route names (default: all)")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "cdms_bench"))
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.routes = [r for r in args.routes.split(",") if r]
+
+    unknown = [r for r in args.routes if r not in ROUTES]
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(unknown)}")
+
+    if args.run_one:
+        results = run_one(args.run_one, args.iterations, args.warmup, args.routes)
+        print(json.dumps(results))
+        return
+
+    sizes = [s for s in args.sizes.split(",") if s]
+    for size in sizes:
+        if size not in DB_SIZES:
+            parser.error(f"unknown size: {size}")
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = {}
+    for size in sizes:
+        template = ensure_database(args.data_dir, size)
+        print(f"Benchmarking {size}...")
+        results[size] = run_size(template, size, args)
+
+    run = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "seed": DATA_SEED,
+            "sizes": {s: DB_SIZES[s] for s in sizes},
+        },
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2)
+
+    print()
+    print_table(results)
+    print(f"\nSaved to {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            old = json.load(f)
+        if compare(old, run, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+"""
+Generates large amounts of realistic test data (schools, partners, visits,
+feedback).
+
+Builds on seed_schools.py: the 30 real schools come first, then made-up
+ones. The same --seed always produces the same data, so benchmark runs
+on generated databases can be compared.
+
+Examples:
+    python generate_data.py --db /tmp/cdms_large.db --schools 10000 --visits 5000000 --feedback 1000000
+    python generate_data.py --db /tmp/cdms_small.db --schools 200 --visits 5000 --feedback 1000 --seed 7
+"""
+import argparse
+import math
+import os
+import random
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+
+import availability
+import seed_schools
+
+BATCH_SIZE = 50_000
+
+# Visits happen on weekdays between these hours, one visit per
+# (date, time) slot - the same conflict rule schedule_visit enforces.
+FIRST_SLOT_MINUTE = 7 * 60 + 30   # 07:30
+LAST_SLOT_MINUTE = 15 * 60        # 15:00
+MAX_DAY_FILL = 0.6                # never book more than 60% of a day's slots
+
+# Fewer trips in the summer break and around Christmas
+MONTH_WEIGHTS = {1: 1.0, 2: 1.1, 3: 1.2, 4: 0.9, 5: 1.2, 6: 0.8,
+                 7: 0.2, 8: 0.2, 9: 1.0, 10: 1.2, 11: 1.2, 12: 0.5}
+
+PLACES = ["Kingston", "Spanish Town", "Portmore", "Montego Bay", "Mandeville",
+          "May Pen", "Ocho Rios", "Savanna-la-Mar", "Port Antonio", "Morant Bay",
+          "Falmouth", "Lucea", "Black River", "Linstead", "Old Harbour",
+          "Half Way Tree", "Constant Spring", "Papine", "Stony Hill", "Bog Walk"]
+KINDS = ["Primary", "Infant", "All Age", "Junior High", "High", "Preparatory",
+         "Technical High", "Comprehensive High"]
+STREETS = ["Main Street", "Church Street", "Hope Road", "Old Hope Road", "King Street",
+           "Market Street", "Red Hills Road", "Spanish Town Road", "Mountain View Avenue",
+           "Barbican Road", "Molynes Road", "Washington Boulevard"]
+FIRST_NAMES = ["Andre", "Beverly", "Claire", "Damian", "Fay", "Horace", "Judith",
+               "Keisha", "Lionel", "Marcia", "Nadine", "Owen", "Paulette", "Sophia",
+               "Trevor", "Tanya", "Kemar", "Shanique", "Romaine", "Yolanda"]
+LAST_NAMES = ["Brown", "Campbell", "Thomas", "McKenzie", "Williams", "Robinson",
+              "Gayle", "Spencer", "Martin", "Burke", "Clarke", "Grant", "Davis",
+              "Forbes", "Sinclair", "Henry", "Blake", "Gray", "Reid", "Lewis"]
+TITLES = ["Mr.", "Mrs.", "Ms.", "Dr."]
+PARTNER_KINDS = ["Science Foundation", "Reading Club", "Rotary Club", "Youth Trust",
+                 "Arts Council", "Coding Academy", "Nature Society", "Business Alliance"]
+PARTNER_SHARE = 0.7               # share of visits run with a partner
+# Attendance of a Completed visit: (mean, spread) per group
+ATTENDANCE = {"students": (45, 20), "teachers": (4, 2), "parents": (3, 3)}
+FEEDBACK_OPENERS = ["The students really enjoyed", "Our class learned a lot from",
+                    "Thank you for organising", "Everyone is still talking about",
+                    "We appreciated the time spent on"]
+FEEDBACK_TOPICS = ["the science demonstrations", "the reading session",
+                   "the careers talk", "the planetarium show", "the art workshop",
+                   "the coding activity", "the nature walk"]
+FEEDBACK_CLOSERS = ["We hope to visit again next term.",
+                    "The facilitators were patient and friendly.",
+                    "Some activities ran a little long for the younger children.",
+                    "Please send more material for the teachers.",
+                    "It was well organised from start to finish."]
+
+
+def batched(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ---------------------------
+# Row generators
+# ---------------------------
+def generate_schools(rng: random.Random, count: int, taken_names: set):
+    """Seeded schools first, then synthetic ones with unique names."""
+    for name, address, contact, phone, email, capacity in seed_schools.schools[:count]:
+        if name.lower() in taken_names:
+            continue
+        taken_names.add(name.lower())
+        yield (name, address, contact, phone, email, capacity,
+               "08:00", "14:30", "", "", max(10, capacity // 25))
+
+    made = 0
+    serial = 0
+    wanted = count - min(count, len(seed_schools.schools))
+    while made < wanted:
+        serial += 1
+        place = rng.choice(PLACES)
+        name = f"{place} {rng.choice(KINDS)} School"
+        if name.lower() in taken_names:
+            name = f"{name} No. {serial}"
+        if name.lower() in taken_names:
+            continue
+        taken_names.add(name.lower())
+        made += 1
+
+        capacity = int(rng.lognormvariate(6.5, 0.6))
+        contact = f"{rng.choice(TITLES)} {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        start_time = rng.choice(["07:30", "08:00", "08:00", "08:30"])
+        end_time = rng.choice(["13:30", "14:00", "14:30", "15:00"])
+        year = 2025 + rng.randint(0, 1)
+        exam_dates = ", ".join(
+            (date(year, 6, 2) + timedelta(days=rng.randint(0, 14))).isoformat()
+            for _ in range(rng.randint(0, 3))
+        )
+        holidays = f"{year}-12-19 to {year + 1}-01-05" if rng.random() < 0.7 else ""
+        yield (
+            name,
+            f"{rng.randint(1, 250)} {rng.choice(STREETS)}, {place}",
+            contact,
+            f"876-{rng.randint(200, 999)}-{rng.randint(0, 9999):04d}",
+            f"school{serial}@example.com",
+            capacity,
+            start_time,
+            end_time,
+            exam_dates,
+            holidays,
+            max(5, capacity // rng.randint(18, 30)),
+        )
+
+
+def visit_time_weights():
+    """Most trips start mid-morning; few right at opening or late afternoon."""
+    minutes = range(FIRST_SLOT_MINUTE, LAST_SLOT_MINUTE + 1)
+    peak = 10 * 60
+    return list(minutes), [math.exp(-((m - peak) / 90.0) ** 2) + 0.05 for m in minutes]
+
+
+def school_timetables(conn):
+    """
+    school id → (first minute, end minute, blackout dates as ISO strings),
+    parsed the same way the app fills school_hours / school_blackouts.
+    """
+    timetables = {}
+    for school_id, start_time, end_time, exam_dates, holidays in conn.execute(
+        "SELECT id, start_time, end_time, exam_dates, holidays FROM schools"
+    ):
+        blackouts = availability.parse_date_list(exam_dates) + availability.parse_date_list(holidays)
+        timetables[school_id] = (
+            availability.parse_time(start_time),
+            availability.parse_time(end_time),
+            {day.isoformat() for day in blackouts},
+        )
+    return timetables
+
+
+def generate_visits(rng, count, school_ids, start, as_of, taken_slots, timetables):
+    """
+    Yields (school_id, visit_date, visit_time, status). No two visits
+    share a date and time, including visits already in the database, and
+    every visit is on a weekday within its school's hours and not on one
+    of its exam days or holidays (the rules schedule_visit enforces).
+    """
+    minutes, weights = visit_time_weights()
+    cum_time = []
+    total = 0.0
+    for w in weights:
+        total += w
+        cum_time.append(total)
+
+    # A few schools get many visits, most get a handful (Zipf-like)
+    cum_school = []
+    total = 0.0
+    for rank in range(1, len(school_ids) + 1):
+        total += 1.0 / rank ** 0.8
+        cum_school.append(total)
+    shuffled_ids = school_ids[:]
+    rng.shuffle(shuffled_ids)
+
+    slots_per_day = len(minutes)
+    per_day_cap = int(slots_per_day * MAX_DAY_FILL)
+    # Long enough that the average day stays well under the cap
+    span_days = max(365, math.ceil(count / (per_day_cap * 0.5) * 7 / 5))
+    mean_per_day = count / (span_days * 5 / 7)
+
+    made = 0
+    day = start
+    give_up = start + timedelta(days=span_days * 10)
+    while made < count:
+        if day > give_up:
+            raise SystemExit("The schools' hours and blackout days leave no room for the visits.")
+        if day.weekday() < 5:
+            mu = mean_per_day * MONTH_WEIGHTS[day.month]
+            wanted = int(round(max(0.0, rng.gauss(mu, math.sqrt(mu) + 0.5))))
+            wanted = min(wanted, per_day_cap, count - made)
+
+            day_iso = day.isoformat()
+            used = taken_slots.get(day_iso, set())
+            attempts = 0
+            while wanted > 0 and attempts < wanted * 20:
+                attempts += 1
+                school_id = shuffled_ids[
+                    rng.choices(range(len(shuffled_ids)), cum_weights=cum_school)[0]
+                ]
+                first, end, blackouts = timetables.get(school_id, (None, None, set()))
+                if day_iso in blackouts:
+                    continue
+                minute = rng.choices(minutes, cum_weights=cum_time)[0]
+                if (first is not None and minute < first) or (end is not None and minute >= end):
+                    continue
+                slot = f"{minute // 60:02d}:{minute % 60:02d}"
+                if slot in used:
+                    continue
+                used.add(slot)
+                wanted -= 1
+                made += 1
+                if day < as_of:
+                    status = "Completed" if rng.random() < 0.95 else "Scheduled"
+                else:
+                    status = "Scheduled"
+                yield (school_id, day_iso, slot, status)
+        day += timedelta(days=1)
+
+
+def generate_partners(rng, count, taken_names: set):
+    """Yields (name, contact_person, contact_email) with unique names."""
+    made = 0
+    attempts = 0
+    while made < count and attempts < count * 50:
+        attempts += 1
+        name = f"{rng.choice(PLACES)} {rng.choice(PARTNER_KINDS)}"
+        if name.lower() in taken_names:
+            name = f"{name} {made + 1}"
+            if name.lower() in taken_names:
+                continue
+        taken_names.add(name.lower())
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        made += 1
+        yield (name, f"{first} {last}", f"{first}.{last}@example.org".lower())
+
+
+def with_partners(rng, visits, partner_ids):
+    """Adds a partner_id to each visit: most have one, a few partners do most visits."""
+    cum = []
+    total = 0.0
+    for rank in range(1, len(partner_ids) + 1):
+        total += 1.0 / rank
+        cum.append(total)
+    for visit in visits:
+        partner_id = None
+        if partner_ids and rng.random() < PARTNER_SHARE:
+            partner_id = partner_ids[rng.choices(range(len(partner_ids)), cum_weights=cum)[0]]
+        yield (*visit, partner_id)
+
+
+def with_attendance(rng, visits):
+    """Adds students, teachers and parents counts to Completed visits (None otherwise)."""
+    for visit in visits:
+        if visit[3] == "Completed":
+            counts = tuple(max(0, int(round(rng.gauss(mean, spread))))
+                           for mean, spread in ATTENDANCE.values())
+            counts = (max(1, counts[0]),) + counts[1:]
+        else:
+            counts = (None, None, None)
+        yield (*visit, *counts)
+
+
+def generate_feedback(rng, count, school_names, start, as_of):
+    span = max(1, (as_of - start).days)
+    for _ in range(count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        trip = start + timedelta(days=rng.randrange(span))
+        created = datetime.combine(trip, datetime.min.time()) + timedelta(
+            days=rng.randint(0, 14), minutes=rng.randint(8 * 60, 20 * 60)
+        )
+        text = " ".join([
+            f"{rng.choice(FEEDBACK_OPENERS)} {rng.choice(FEEDBACK_TOPICS)}.",
+            rng.choice(FEEDBACK_CLOSERS),
+        ])
+        yield (
+            None,
+            f"{first} {last}",
+            rng.choice(school_names),
+            f"{first.lower()}.{last.lower()}{rng.randint(1, 999)}@example.com",
+            text,
+            trip.isoformat(),
+            created.isoformat(sep=" "),
+        )
+
+
+# ---------------------------
+# Loading
+# ---------------------------
+def drop_write_triggers(conn):
+    """
+    Drops the app's sync triggers (versions, search index, rollups) so the
+    bulk load doesn't fire them per row. They are recreated afterwards.
+    """
+    names = [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+        "AND tbl_name IN ('schools', 'visits', 'feedback')"
+    )]
+    for name in names:
+        conn.execute(f'DROP TRIGGER IF EXISTS "{name}"')
+    conn.commit()
+
+
+def load(conn, sql, rows, label):
+    started = time.perf_counter()
+    total = 0
+    for batch in batched(rows):
+        conn.executemany(sql, batch)
+        total += len(batch)
+    conn.commit()
+    print(f"  {label}: {total} rows in {time.perf_counter() - started:.1f}s")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default=seed_schools.DATABASE, help="SQLite file to fill")
+    parser.add_argument("--schools", type=int, default=1000)
+    parser.add_argument("--partners", type=int, default=25)
+    parser.add_argument("--visits", type=int, default=50_000)
+    parser.add_argument("--feedback", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=2140)
+    parser.add_argument("--start-date", default="2020-01-06",
+                        help="first visit date (YYYY-MM-DD)")
+    parser.add_argument("--as-of", default=None,
+                        help="visits before this date are marked Completed "
+                             "(default: 80%% of the way through the data)")
+    args = parser.parse_args()
+
+    # The app binds its database path on import, so point it at the
+    # target file first, then create the schema (tables, indexes, triggers)
+    os.environ["CDMS_DATABASE"] = os.path.abspath(args.db)
+    import app as cdms
+    with cdms.app.app_context():
+        cdms.ensure_schema()
+
+    rng = random.Random(args.seed)
+    start = date.fromisoformat(args.start_date)
+
+    conn = sqlite3.connect(args.db)
+    # Loading pragmas: no fsync per commit, big page cache, temp in memory
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-262144")  # 256 MB
+    conn.execute("PRAGMA temp_store=MEMORY")
+    drop_write_triggers(conn)
+
+    print(f"Generating into {args.db} (seed {args.seed})")
+
+    taken_names = {r[0] for r in conn.execute("SELECT LOWER(name) FROM schools")}
+    load(conn, """
+        INSERT INTO schools
+        (name, address, contact_person, contact_phone, contact_email,
+        capacity, start_time, end_time, exam_dates, holidays, num_teachers)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, generate_schools(rng, args.schools, taken_names), "schools")
+
+    school_rows = conn.execute("SELECT id, name FROM schools ORDER BY id").fetchall()
+    school_ids = [r[0] for r in school_rows]
+    school_names = [r[1] for r in school_rows]
+
+    taken_partners = {r[0] for r in conn.execute("SELECT LOWER(name) FROM partners")}
+    # Own random stream, so the visits are the same as without partners
+    partner_rng = random.Random(args.seed + 1)
+    load(conn, """
+        INSERT INTO partners (name, contact_person, contact_email)
+        VALUES (?, ?, ?)
+    """, generate_partners(partner_rng, args.partners, taken_partners), "partners")
+    partner_ids = [r[0] for r in conn.execute("SELECT id FROM partners ORDER BY id")]
+    attendance_rng = random.Random(args.seed + 2)
+
+    taken_slots = {}
+    for visit_date, visit_time in conn.execute("SELECT visit_date, visit_time FROM visits"):
+        taken_slots.setdefault(visit_date, set()).add(visit_time)
+
+    # The visit span grows with the volume; estimate its end for as_of
+    minutes, _ = visit_time_weights()
+    per_day_cap = int(len(minutes) * MAX_DAY_FILL)
+    span_days = max(365, math.ceil(args.visits / (per_day_cap * 0.5) * 7 / 5))
+    as_of = (date.fromisoformat(args.as_of) if args.as_of
+             else start + timedelta(days=int(span_days * 0.8)))
+
+    if school_ids:
+        load(conn, """
+            INSERT INTO visits (school_id, visit_date, visit_time, status, partner_id,
+                                students, teachers, parents)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, with_attendance(attendance_rng, with_partners(
+            partner_rng,
+            generate_visits(rng, args.visits, school_ids, start, as_of, taken_slots,
+                            school_timetables(conn)),
+            partner_ids,
+        )), "visits")
+
+        load(conn, """
+            INSERT INTO feedback
+            (visit_id, "Name", "School_name", "Email", "Feedback", "TripDate", created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, generate_feedback(rng, args.feedback, school_names, start, as_of), "feedback")
+
+    conn.close()
+
+    # Put the triggers back and rebuild everything they would have maintained
+    print("Rebuilding indexes and rollups...")
+    with cdms.app.app_context():
+        cdms.ensure_schema()
+        db_conn = cdms.get_db_connection()
+        if cdms.FTS_ENABLED:
+            for fts_table in cdms.SEARCH_INDEXES:
+                db_conn.execute(f"INSERT INTO {fts_table} ({fts_table}) VALUES ('rebuild')")
+        cdms.rebuild_visit_rollups(db_conn)
+        cdms.rebuild_school_availability(db_conn)
+        db_conn.execute("UPDATE data_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP")
+        db_conn.execute("ANALYZE")
+        db_conn.commit()
+        # The app runs in WAL mode, so most of the data is still in the
+        # -wal file: fold it into the main file and close the pool, so the
+        # .db can be copied (or opened) on its own
+        db_conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    with cdms.app.app_context():
+        cdms.db.engine.dispose()
+    print("DONE!")
+
+
+if __name__ == "__main__":
+    main()
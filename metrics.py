@@ -0,0 +1,123 @@
+"""
+Small in-process metrics registry with Prometheus text output.
+
+Histograms cover the timings (requests, SQL, templates); gauges report
+a current value, such as a queue depth, read when /metrics is scraped.
+Each gunicorn worker keeps its own numbers; scrape every worker, or run
+one worker when you need exact totals.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Seconds. Most pages should land in the low buckets; reports and exports
+# can take a few seconds on big databases.
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+LabelValues = Tuple[str, ...]
+
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label combination."""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # label values → [count per bucket..., +Inf count, sum]
+        self.series: Dict[LabelValues, List[float]] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        with self.lock:
+            snapshot = {key: list(values) for key, values in self.series.items()}
+        for label_values, series in sorted(snapshot.items()):
+            labels = ",".join(
+                f'{name}="{escape(value)}"' for name, value in zip(self.labels, label_values)
+            )
+            prefix = labels + "," if labels else ""
+            for bound, count in zip(self.buckets, series):
+                yield f'{self.name}_bucket{{{prefix}le="{bound:g}"}} {count}'
+            yield f'{self.name}_bucket{{{prefix}le="+Inf"}} {series[-2]}'
+            braced = f"{{{labels}}}" if labels else ""
+            yield f"{self.name}_sum{braced} {series[-1]:.6f}"
+            yield f"{self.name}_count{braced} {series[-2]}"
+
+
+class Gauge:
+    """A value read from a callback at scrape time."""
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], float]):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {self.read():g}"
+
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Registry:
+    def __init__(self):
+        self.histograms: Dict[str, Histogram] = {}
+        self.gauges: Dict[str, Gauge] = {}
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = TIME_BUCKETS,
+    ) -> Histogram:
+        if name not in self.histograms:
+            self.histograms[name] = Histogram(name, help_text, labels, buckets)
+        return self.histograms[name]
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], float]) -> Gauge:
+        self.gauges[name] = Gauge(name, help_text, read)
+        return self.gauges[name]
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for histogram in self.histograms.values():
+            lines.extend(histogram.render())
+        for gauge in self.gauges.values():
+            lines.extend(gauge.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+@contextmanager
+def timed(histogram: Optional[Histogram], *label_values: str):
+    """Observes how long the block took. Does nothing if histogram is None."""
+    if histogram is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started, *label_values)
@@ -22,6 +22,9 @@ CREATE TABLE IF NOT EXISTS schools (
     -- Number of students at the school (can be empty)
     capacity INTEGER,
 
+    -- Short location shown on the visit schedule page (can be empty)
+    location TEXT,
+
     -- The time school starts (stored as text for simplicity)
     start_time TEXT,
 
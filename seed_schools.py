@@ -48,12 +48,12 @@ def seed():
 
     print("Inserting schools...")
 
-    for school in schools:
-        cur.execute("""
-            INSERT INTO schools
-            (name, address, contact_person, contact_phone, contact_email, capacity)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, school)
+    # One executemany in one transaction instead of a statement per school
+    cur.executemany("""
+        INSERT INTO schools
+        (name, address, contact_person, contact_phone, contact_email, capacity)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, schools)
 
     conn.commit()
     conn.close()
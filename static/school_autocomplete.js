@@ -0,0 +1,47 @@
+// School name autocomplete for inputs marked data-school-autocomplete.
+//
+// Suggestions come from /schools/autocomplete as you type and fill the
+// input's <datalist>. If the input has data-id-field="<input id>", that
+// (hidden) input gets the id of the school whose name was picked.
+(function () {
+    var url = document.currentScript.dataset.url;
+
+    document.querySelectorAll('input[data-school-autocomplete]').forEach(function (input) {
+        var list = document.getElementById(input.getAttribute('list'));
+        var idField = input.dataset.idField ? document.getElementById(input.dataset.idField) : null;
+        var known = {};  // lower-cased name -> id, for everything suggested so far
+        var timer = null;
+
+        function syncId() {
+            if (idField) {
+                idField.value = known[input.value.trim().toLowerCase()] || '';
+            }
+        }
+
+        input.addEventListener('input', function () {
+            syncId();
+            clearTimeout(timer);
+            var q = input.value.trim();
+            if (!q) {
+                return;
+            }
+            timer = setTimeout(function () {
+                fetch(url + '?q=' + encodeURIComponent(q))
+                    .then(function (r) { return r.json(); })
+                    .then(function (schools) {
+                        list.innerHTML = '';
+                        schools.forEach(function (s) {
+                            known[s.name.toLowerCase()] = s.id;
+                            var option = document.createElement('option');
+                            option.value = s.name;
+                            if (s.location) {
+                                option.label = s.location;
+                            }
+                            list.appendChild(option);
+                        });
+                        syncId();
+                    });
+            }, 150);
+        });
+    });
+})();